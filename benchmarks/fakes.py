@@ -0,0 +1,248 @@
+"""
+Local stand-ins for the Beatport and Spotify APIs.
+
+Both servers generate a synthetic week of tracks on the fly, wait a fixed
+latency before answering and reject a share of requests with 429 to exercise
+the retry paths of the adapters.
+"""
+
+import json
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MARKETS = [f"M{i:03d}" for i in range(180)]
+NOT_FOUND_EVERY = 10
+
+
+def make_isrc(index: int) -> str:
+    return f"BENCH{index:010d}"
+
+
+def make_bp_track(index: int, style_id: int, publish_date: str) -> dict:
+    """Returns a synthetic Beatport track shaped like the API payload."""
+    return {
+        "id": 10_000_000 + index,
+        "isrc": make_isrc(index),
+        "name": f"Track {index}",
+        "mix_name": "Original Mix",
+        "publish_date": publish_date,
+        "new_release_date": publish_date,
+        "bpm": 120 + index % 60,
+        "length_ms": 300_000 + index % 60_000,
+        "genre": {"id": style_id if index % 3 else 5, "name": "Genre"},
+        "key": {"id": index % 24, "name": "A Minor"},
+        "artists": [
+            {"id": index % 997, "name": f"Artist {index % 997}", "slug": "artist"}
+        ],
+        "release": {
+            "id": 1_000_000 + index // 4,
+            "name": f"Release {index // 4}",
+            "image": {"uri": "https://example.com/image.jpg"},
+        },
+        "label": {"id": index % 101, "name": f"Label {index % 101}"},
+        "image": {"uri": "https://example.com/image.jpg", "dynamic_uri": ""},
+    }
+
+
+def make_sp_track(index: int, new_release_date: str, old_release_date: str) -> dict:
+    """Returns a synthetic Spotify track shaped like the search payload."""
+    return {
+        "id": f"sp{index:010d}",
+        "uri": f"spotify:track:sp{index:010d}",
+        "name": f"Track {index}",
+        "popularity": index % 100,
+        "duration_ms": 300_000,
+        "explicit": False,
+        "external_ids": {"isrc": make_isrc(index)},
+        "external_urls": {"spotify": f"https://open.spotify.com/track/{index}"},
+        "available_markets": MARKETS,
+        "artists": [{"id": f"ar{index % 997}", "name": f"Artist {index % 997}"}],
+        "album": {
+            "id": f"al{index // 4}",
+            "name": f"Release {index // 4}",
+            "release_date": new_release_date if index % 2 else old_release_date,
+            "available_markets": MARKETS,
+            "images": [{"url": "https://example.com/image.jpg"}] * 3,
+        },
+    }
+
+
+class FakeServer(ABC):
+    """
+    Runs a request handler on a local threaded HTTP server.
+
+    Args:
+        latency: Seconds to wait before answering each request
+        throttle_rate: Share of requests answered with 429
+        retry_after: Retry-After seconds sent with 429 responses
+    """
+
+    def __init__(
+        self, latency: float = 0.0, throttle_rate: float = 0.0, retry_after: int = 0
+    ):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(42)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _throttle(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            throttled = self._random.random() < self.throttle_rate
+            self.throttled += throttled
+        return throttled
+
+    @abstractmethod
+    def handle(self, method: str, path: str, query: dict, body) -> tuple[int, dict]:
+        """Answers a request with a status code and a JSON body."""
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw_body = self.rfile.read(length) if length else b""
+                time.sleep(fake.latency)
+                if fake._throttle():
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(fake.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                parsed = urlparse(self.path)
+                query = {
+                    key: values[0] for key, values in parse_qs(parsed.query).items()
+                }
+                body = json.loads(raw_body) if raw_body else None
+                status, payload = fake.handle(self.command, parsed.path, query, body)
+                encoded = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            do_GET = do_POST = do_DELETE = do_PUT = _respond  # noqa: N815
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class FakeBeatport(FakeServer):
+    """Paginated `/tracks/` endpoint serving `track_count` synthetic tracks."""
+
+    def __init__(self, track_count: int, style_id: int, publish_date: str, **kwargs):
+        super().__init__(**kwargs)
+        self.track_count = track_count
+        self.style_id = style_id
+        self.publish_date = publish_date
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.url}/v4/catalog"
+
+    def handle(self, method: str, path: str, query: dict, body) -> tuple[int, dict]:
+        if method != "GET" or not path.endswith("/tracks/"):
+            return 404, {"detail": "Not found"}
+        page = int(query.get("page", 1))
+        per_page = int(query.get("per_page", 100))
+        start = (page - 1) * per_page
+        end = min(start + per_page, self.track_count)
+        results = [
+            make_bp_track(index, self.style_id, self.publish_date)
+            for index in range(start, end)
+        ]
+        next_page = None
+        if end < self.track_count:
+            next_page = f"{self.api_url}/tracks/?page={page + 1}&per_page={per_page}"
+        return 200, {
+            "count": self.track_count,
+            "page": f"{page}/{-(-self.track_count // per_page)}",
+            "per_page": per_page,
+            "next": next_page,
+            "results": results,
+        }
+
+
+class FakeSpotify(FakeServer):
+    """Search by ISRC and playlist endpoints backed by in-memory playlists."""
+
+    def __init__(self, new_release_date: str, old_release_date: str, **kwargs):
+        super().__init__(**kwargs)
+        self.new_release_date = new_release_date
+        self.old_release_date = old_release_date
+        self.playlists: dict[str, list[str]] = {}
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.url}/v1/"
+
+    def _search(self, query: dict) -> dict:
+        index = int(query["q"].removeprefix("isrc:").removeprefix("BENCH"))
+        items = []
+        if index % NOT_FOUND_EVERY != NOT_FOUND_EVERY - 1:
+            items.append(
+                make_sp_track(index, self.new_release_date, self.old_release_date)
+            )
+        return {"tracks": {"items": items, "total": len(items)}}
+
+    def _playlist_items(self, playlist_id: str, query: dict) -> dict:
+        uris = self.playlists.get(playlist_id, [])
+        offset = int(query.get("offset", 0))
+        limit = int(query.get("limit", 100))
+        items = [{"track": {"uri": uri}} for uri in uris[offset : offset + limit]]
+        has_next = offset + limit < len(uris)
+        return {"items": items, "next": "next" if has_next else None}
+
+    def handle(self, method: str, path: str, query: dict, body) -> tuple[int, dict]:
+        parts = path.strip("/").split("/")[1:]
+        with self._lock:
+            if method == "GET" and parts == ["search"]:
+                return 200, self._search(query)
+            if method == "GET" and parts == ["me"]:
+                return 200, {"id": "bench"}
+            if method == "POST" and parts[0] == "users" and parts[2:] == ["playlists"]:
+                playlist_id = f"pl{len(self.playlists):06d}"
+                self.playlists[playlist_id] = []
+                return 201, {"id": playlist_id, "name": body["name"]}
+            if parts[0] == "playlists" and parts[2:] == ["tracks"]:
+                playlist_id = parts[1]
+                if method == "GET":
+                    return 200, self._playlist_items(playlist_id, query)
+                if method == "POST":
+                    self.playlists[playlist_id].extend(body)
+                    return 201, {"snapshot_id": "bench"}
+                if method == "DELETE":
+                    removed = {track["uri"] for track in body["tracks"]}
+                    self.playlists[playlist_id] = [
+                        uri for uri in self.playlists[playlist_id] if uri not in removed
+                    ]
+                    return 200, {"snapshot_id": "bench"}
+        return 404, {"error": {"status": 404, "message": "Not found"}}
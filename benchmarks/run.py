@@ -0,0 +1,239 @@
+"""
+Offline throughput benchmark of the harvest pipeline.
+
+Runs the Beatport, Spotify and playlist stages against local fake APIs and a
+throwaway MongoDB database, and reports items/sec and the peak RSS of each
+stage. The peak RSS is reset before every stage, which only Linux supports.
+
+Usage:
+    python -m benchmarks.run --tracks 1000,10000,50000 --latency 0.05
+    python -m benchmarks.run --in-memory --throttle-rate 0.05 --output bench.json
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Annotated
+
+import typer
+
+from benchmarks.fakes import FakeBeatport, FakeSpotify
+
+ROOT = Path(__file__).resolve().parents[1]
+
+BENCH_WEEK, BENCH_YEAR, BENCH_STYLE_ID = 7, 2025, 90
+
+app = typer.Typer()
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the peak RSS of the process, so the next reading covers one stage.
+
+    Returns False where it cannot be reset, as the peak would then include
+    every earlier stage and size.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss_mb() -> float:
+    """Returns the peak RSS since the last reset."""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    raise OSError("VmHWM missing from /proc/self/status")
+
+
+def prepare_environment(
+    workdir: Path, bp_url: str, sp_url: str, mongo_url: str, sp_rate_limit: float
+):
+    """
+    Points the settings at the fakes and stores a fake Spotify token in `workdir`.
+
+    Must run before the settings are first read.
+    """
+    sp_token = {
+        "access_token": "bench-token",
+        "token_type": "Bearer",
+        "expires_in": 3600,
+        "expires_at": int(time.time()) + 86_400,
+        "refresh_token": "bench-refresh",
+        "scope": "playlist-read-private playlist-modify-public playlist-modify-private",
+    }
+    (workdir / ".cache").write_text(json.dumps(sp_token))
+    os.environ.update(
+        {
+            "ENV": "bench",
+            "LOG_LEVEL": "WARNING",
+            "INTERACTIVE": "false",
+            "BP_API_TOKEN": "bench-token",
+            "BP_API_URL": bp_url,
+            "SP_API_URL": sp_url,
+            "SP_RATE_LIMIT": str(sp_rate_limit),
+            "BP_RATE_LIMIT": "1000",
+            "MONGO_URL": mongo_url,
+            "MONGO_DB": "clouder_bench",
+            "SPOTIPY_CLIENT_ID": "bench",
+            "SPOTIPY_CLIENT_SECRET": "bench",
+            "SPOTIPY_REDIRECT_URI": "http://127.0.0.1:8080",
+        }
+    )
+    os.chdir(workdir)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+
+def run_size(
+    track_count: int, fake_bp: FakeBeatport, fake_sp: FakeSpotify, streaming: bool
+) -> list:
+    from src.clouder_beats.bp_adapter import BPItemType
+    from src.clouder_beats.collectors import (
+        collect_bp_items,
+        collect_sp_tracks,
+        create_sp_playlists,
+        populate_sp_playlists,
+        stream_tracks,
+    )
+    from src.clouder_beats.config import settings
+    from src.clouder_beats.mongo_adapter import get_data, get_mongo_client
+    from src.clouder_beats.week_harvest import WeekHarvest
+
+    settings.mongo_db = f"clouder_bench_{track_count}"
+    get_mongo_client().drop_database(settings.mongo_db)
+    fake_bp.track_count = track_count
+    fake_sp.playlists.clear()
+    week_harvest = WeekHarvest(BENCH_WEEK, BENCH_YEAR, BENCH_STYLE_ID)
+
+    def create_playlists() -> int:
+        create_sp_playlists(week_harvest)
+        return len(fake_sp.playlists)
+
+    if streaming:
+        stages = [
+            ("pipeline", lambda: stream_tracks(week_harvest)["beatport"]["full_cnt"])
+        ]
+    else:
+        stages = [
+            (
+                "beatport_tracks",
+                lambda: collect_bp_items(week_harvest, BPItemType.TRACK)["full_cnt"],
+            ),
+            ("spotify", lambda: collect_sp_tracks(week_harvest)["full_cnt"]),
+        ]
+    stages += [
+        ("create_playlists", create_playlists),
+        ("sp_playlist", lambda: sum(populate_sp_playlists(week_harvest).values())),
+    ]
+    results = []
+    for stage, run_stage in stages:
+        rss_reset = reset_peak_rss()
+        started = time.perf_counter()
+        items = run_stage()
+        seconds = time.perf_counter() - started
+        results.append(
+            {
+                "tracks": track_count,
+                "stage": stage,
+                "items": items,
+                "seconds": round(seconds, 3),
+                "items_per_sec": round(items / seconds, 1) if items else 0,
+                "peak_rss_mb": round(peak_rss_mb(), 1) if rss_reset else None,
+            }
+        )
+
+    statistics = get_data("statistics", {"id": week_harvest.clouder_week})
+    stage_metrics = statistics[0] if statistics else {}
+    for result in results:
+        result["metrics"] = stage_metrics.get(f"{result['stage']}_metrics")
+    get_mongo_client().drop_database(settings.mongo_db)
+    return results
+
+
+def print_results(results: list[dict]):
+    typer.echo(
+        f"{'tracks':>7}  {'stage':<16}  {'items':>7}  {'seconds':>8}  "
+        f"{'items/sec':>10}  {'peak RSS MB':>11}"
+    )
+    for result in results:
+        peak_rss = result["peak_rss_mb"]
+        typer.echo(
+            f"{result['tracks']:>7}  {result['stage']:<16}  {result['items']:>7}  "
+            f"{result['seconds']:>8.2f}  {result['items_per_sec']:>10.1f}  "
+            f"{'n/a' if peak_rss is None else f'{peak_rss:.1f}':>11}"
+        )
+
+
+@app.command()
+def main(
+    tracks: str = typer.Option("1000,10000", help="Week sizes, e.g. '1000,50000'"),
+    latency: float = typer.Option(0.02, help="Seconds added to every API call"),
+    throttle_rate: float = typer.Option(0.0, help="Share of calls answered 429"),
+    retry_after: int = typer.Option(0, help="Retry-After seconds sent with 429s"),
+    mongo_url: str = typer.Option(
+        "mongodb://localhost:27017", help="Local MongoDB used as the stand-in"
+    ),
+    in_memory: bool = typer.Option(False, help="Use mongomock instead of MongoDB"),
+    streaming: bool = typer.Option(
+        False, help="Run the Beatport and Spotify stages as one pipeline"
+    ),
+    sp_rate_limit: float = typer.Option(
+        1000.0, help="Spotify searches per second allowed by the limiter"
+    ),
+    output: Annotated[
+        Path | None, typer.Option(help="Write the results as JSON")
+    ] = None,
+):
+    """Benchmarks the pipeline stages on synthetic weeks."""
+    sizes = [int(size) for size in tracks.split(",")]
+    fake_options = {
+        "latency": latency,
+        "throttle_rate": throttle_rate,
+        "retry_after": retry_after,
+    }
+    fake_bp = FakeBeatport(0, BENCH_STYLE_ID, "2025-02-10", **fake_options)
+    fake_sp = FakeSpotify("2025-02-10", "2024-01-01", **fake_options)
+    logging.basicConfig(level=logging.WARNING)
+
+    with (
+        tempfile.TemporaryDirectory() as workdir,
+        fake_bp,
+        fake_sp,
+    ):
+        prepare_environment(
+            Path(workdir), fake_bp.api_url, fake_sp.api_url, mongo_url, sp_rate_limit
+        )
+        from src.clouder_beats import mongo_adapter
+
+        if in_memory:
+            import mongomock
+
+            mongo_adapter._client = mongomock.MongoClient()
+        try:
+            results = []
+            for size in sizes:
+                results.extend(run_size(size, fake_bp, fake_sp, streaming))
+        finally:
+            os.chdir(ROOT)
+            mongo_adapter.close_mongo_client()
+
+    print_results(results)
+    typer.echo(
+        f"beatport: {fake_bp.requests} requests, {fake_bp.throttled} throttled; "
+        f"spotify: {fake_sp.requests} requests, {fake_sp.throttled} throttled"
+    )
+    if output:
+        output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    app()
@@ -5,129 +5,395 @@ This module provides functionality to interact with the Beatport API,
 including making requests and collecting releases or tracks for a given week.
 It handles pagination and error cases when communicating with the API.
 
+All requests go through a single pooled session, so pages of one harvest
+reuse the same keep-alive connection. Throttled (429) and server (5xx)
+responses are retried with jittered exponential backoff honoring
+Retry-After, and a 401 refreshes the token and replays the request.
+
 Classes:
     ReleaseType: Enum for different types of items that can be retrieved
+    BPApiError: Raised when a page could not be fetched after all retries
 
 Functions:
-    request_bp_api: Makes a single request to the Beatport API
-    collect_bp_items: Collects all items from Beatport API for a given week
-    collect_release_tracks: Collects all tracks for a specific release
+    get_bp_session: Returns the shared pooled HTTP session
+    request_bp_page: Requests one page and returns the decoded response
+    fetch_bp_pages: Collects pages from Beatport API for a given week,
+        fetching them concurrently when the page count is known, archiving
+        them or replaying them from the archive
+    fetch_bp_items: Collects all items from Beatport API for a given week
+    fetch_release_tracks: Collects all tracks for a specific release
         from the Beatport API
+    fetch_releases_tracks: Collects the tracks of several releases concurrently
 """
 
 import logging
+import math
+import random
+import threading
 import time
+from collections import deque
 from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from itertools import islice
 
 import requests
 
+from src.clouder_beats.bp_archive import archive_bp_page, replay_bp_pages
 from src.clouder_beats.config import get_bp_token, settings
+from src.clouder_beats.http_adapter import LimitedHTTPAdapter, retry_after_seconds
+from src.clouder_beats.limits import Resource
+from src.clouder_beats.metrics import propagate_metrics, record_call, record_retry
+from src.clouder_beats.rate_limiter import get_api_limiter
 from src.clouder_beats.week_harvest import WeekHarvest
 
 logger = logging.getLogger("bp")
 
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+_token_lock = threading.Lock()
+
 
 class BPItemType(Enum):
     RELEASE = "releases"
     TRACK = "tracks"
 
 
-def request_bp_api(url: str, params: dict) -> tuple[list, str, dict, bool]:
+class BPApiError(Exception):
+    """Raised when the Beatport API keeps failing after all retries."""
+
+
+def get_bp_session() -> requests.Session:
+    """
+    Returns the module-level Beatport session, creating it on first use.
+
+    The session keeps connections alive between requests and limits the number
+    of connections per host to `bp_pool_maxsize`. Every request goes through
+    the shared Beatport limiter.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = LimitedHTTPAdapter(
+                get_api_limiter(Resource.BEATPORT),
+                pool_connections=settings.bp_pool_connections,
+                pool_maxsize=settings.bp_pool_maxsize,
+                pool_block=True,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(
+                {
+                    "Accept": "application/json",
+                    "Content-Type": "application/json",
+                }
+            )
+            _session = session
+        return _session
+
+
+def close_bp_session():
+    """Closes the shared Beatport session and its pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _get_bp_token() -> str:
+    """Returns the current Beatport token, loading it on first use."""
+    if settings.bp_api_token is None:
+        with _token_lock:
+            if settings.bp_api_token is None:
+                settings.bp_api_token = get_bp_token()
+    return settings.bp_api_token
+
+
+def _refresh_bp_token(stale_token: str):
+    """
+    Refreshes the Beatport token unless another request already did it.
+    """
+    with _token_lock:
+        if settings.bp_api_token == stale_token:
+            settings.bp_api_token = get_bp_token(stale_token)
+
+
+def _retry_delay(response: requests.Response | None, attempt: int) -> float:
+    """
+    Returns how long to wait before the next attempt.
+
+    Uses the Retry-After header when the server sends one, otherwise
+    exponential backoff with full jitter.
     """
-    Requests the Beatport API.
+    retry_after = retry_after_seconds(response) if response is not None else None
+    if retry_after is not None:
+        return min(retry_after, settings.bp_backoff_max)
+    backoff = min(settings.bp_backoff_max, settings.bp_backoff_base * 2**attempt)
+    return random.uniform(0, backoff)
+
+
+def request_bp_page(url: str, params: dict) -> dict:
+    """
+    Requests one page from the Beatport API and returns the decoded JSON.
+
+    Raises:
+        BPApiError: If the page could not be fetched after all retries
     """
-    logger.info(f"Requesting {url} with params {params}")
-    if not url.startswith("https://"):
+    if "://" not in url:
         url = f"https://{url}"
-    headers = {
-        "Authorization": f"Bearer {settings.bp_api_token}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    response = requests.get(url, params=params, headers=headers)
-    if response.status_code == 401:
-        new_token = get_bp_token(True)
-        settings.bp_api_token = new_token
-    try:
-        response.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        logger.error(f"HTTP error occurred: {e}")
-        return [], url, params, True
-    one_page = response.json()
-    next_page = one_page["next"]
-    cur_page = one_page["page"]
-    full_count = one_page["count"]
-    logger.info(
-        f"Got {len(one_page['results'])} results on page {cur_page} of {full_count}"
+    session = get_bp_session()
+    token_refreshed = False
+    attempt = 0
+    while True:
+        token = _get_bp_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        response = None
+        started = time.monotonic()
+        try:
+            response = session.get(
+                url, params=params, headers=headers, timeout=settings.bp_timeout
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = str(e)
+        else:
+            record_call(Resource.BEATPORT, time.monotonic() - started)
+            if response.status_code == 401 and not token_refreshed:
+                logger.warning("Unauthorized request to %s :: Refreshing token", url)
+                _refresh_bp_token(token)
+                token_refreshed = True
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                try:
+                    response.raise_for_status()
+                except requests.exceptions.HTTPError as e:
+                    raise BPApiError(f"HTTP error occurred: {e}") from e
+                return response.json()
+            error = f"HTTP {response.status_code}"
+
+        if attempt >= settings.bp_max_retries:
+            raise BPApiError(f"Giving up on {url} after {attempt + 1} attempts")
+        delay = _retry_delay(response, attempt)
+        attempt += 1
+        record_retry(Resource.BEATPORT)
+        logger.warning(
+            "Request to %s failed (%s) :: retry %s/%s in %.1fs",
+            url,
+            error,
+            attempt,
+            settings.bp_max_retries,
+            delay,
+        )
+        time.sleep(delay)
+
+
+def _fetch_pages_concurrently(
+    url: str, params: dict, pages: range
+) -> Generator[tuple[int, dict]]:
+    """
+    Fetches the given page numbers with at most `bp_concurrency` requests in
+    flight and yields them back in page order.
+
+    Only a small window of pages is requested ahead of the consumer, so
+    memory stays bounded however many pages the week has.
+    """
+    window = settings.bp_concurrency * 2
+    fetch_page = propagate_metrics(request_bp_page)
+    executor = ThreadPoolExecutor(
+        max_workers=settings.bp_concurrency, thread_name_prefix="bp"
     )
-    return one_page["results"], next_page, dict(), False
+    pending = deque()
+    page_iter = iter(pages)
+    try:
+        for page in islice(page_iter, window):
+            pending.append(
+                (page, executor.submit(fetch_page, url, {**params, "page": page}))
+            )
+        while pending:
+            page, future = pending.popleft()
+            one_page = future.result()
+            next_page = next(page_iter, None)
+            if next_page is not None:
+                pending.append(
+                    (
+                        next_page,
+                        executor.submit(fetch_page, url, {**params, "page": next_page}),
+                    )
+                )
+            yield page, one_page
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
-def fetch_bp_items(
-    week_harvest: WeekHarvest, bp_item_type: BPItemType
-) -> Generator[dict]:
+def _request_bp_pages(
+    week_harvest: WeekHarvest, bp_item_type: BPItemType, params: dict, serial: bool
+) -> Generator[tuple[int, dict]]:
     """
-    Collects items from Beatport API for a given week and release type.
+    Requests the pages of a week from `params["page"]` on and yields them raw.
+
+    The first page tells how many items the week has, so with
+    `bp_concurrency` above 1 the remaining pages are requested in parallel.
+    Otherwise, or with `serial`, the `next` links are followed one page at a
+    time.
+    """
+    url = f"{settings.bp_api_url}/{bp_item_type.value}/"
+    start_page = params["page"]
+
+    if settings.bp_concurrency > 1 and not serial:
+        first_page = request_bp_page(url, params)
+        last_page = math.ceil(first_page["count"] / params["per_page"])
+        logger.info(
+            "Got %s results on page %s of %s",
+            len(first_page["results"]),
+            start_page,
+            last_page,
+        )
+        yield start_page, first_page
+        pages = _fetch_pages_concurrently(
+            url, params, range(start_page + 1, last_page + 1)
+        )
+        for page, one_page in pages:
+            logger.info(
+                "Got %s results on page %s of %s",
+                len(one_page["results"]),
+                page,
+                last_page,
+            )
+            yield page, one_page
+    else:
+        page = start_page
+        while url:
+            logger.debug("Requesting %s with params %s", url, params)
+            try:
+                one_page = request_bp_page(url, params)
+            except BPApiError as e:
+                raise BPApiError(
+                    f"Failed to collect {bp_item_type.value} for {week_harvest}"
+                ) from e
+            logger.info(
+                "Got %s results on page %s of %s",
+                len(one_page["results"]),
+                page,
+                one_page["count"],
+            )
+            yield page, one_page
+            url, params = one_page["next"], {}
+            page += 1
+
+
+def fetch_bp_pages(
+    week_harvest: WeekHarvest,
+    bp_item_type: BPItemType,
+    start_page: int = 1,
+    serial: bool = False,
+) -> Generator[tuple[int, list[dict]]]:
+    """
+    Collects pages from Beatport API for a given week and release type.
+
+    With `bp_archive_dir` set every raw page is also written to the archive,
+    and with `bp_replay` the pages are read back from it instead of the API.
 
     Args:
         week_harvest: WeekHarvest object containing week and style information
         bp_item_type: Type of items to collect (releases or tracks)
+        start_page: Page to start from, to resume an interrupted harvest
+        serial: Request one page at a time, so a consumer that stops early
+            does not pay for pages requested ahead
 
     Yields:
-        Individual items from the API response
+        Page number and the items of that page, in page order
+
+    Raises:
+        BPApiError: If a page could not be fetched, so that a failed request
+            never silently shortens the harvest
+        ArchiveMissError: If replaying a week the archive does not fully hold
     """
-    logger.info(f"Collecting {bp_item_type.value} for {week_harvest} :: Starting")
+    logger.info("Collecting %s for %s :: Starting", bp_item_type.value, week_harvest)
 
     params = {
         "genre_id": week_harvest.style_id,
         "publish_date": f"{week_harvest.week_start}:{week_harvest.week_end}",
-        "page": 1,
+        "page": start_page,
         "per_page": 100,
         "order_by": "-publish_date",
     }
 
-    url = f"{settings.bp_api_url}/{bp_item_type.value}/"
+    if settings.bp_replay:
+        pages = replay_bp_pages(week_harvest, bp_item_type.value, start_page)
+    else:
+        pages = _request_bp_pages(week_harvest, bp_item_type, params, serial)
+    for page, one_page in pages:
+        if settings.bp_archive_dir and not settings.bp_replay:
+            archive_bp_page(
+                week_harvest, bp_item_type.value, page, params["per_page"], one_page
+            )
+        yield page, one_page["results"]
 
-    while url:
-        items, url, params, failed = request_bp_api(url, params)
-        yield from items
+    logger.info("Collecting %s for %s :: Done", bp_item_type.value, week_harvest)
 
-    logger.info(f"Collecting {bp_item_type.value} for {week_harvest} :: Done")
 
+def fetch_bp_items(
+    week_harvest: WeekHarvest, bp_item_type: BPItemType
+) -> Generator[dict]:
+    """
+    Collects items from Beatport API for a given week and release type.
 
-def fetch_release_tracks(release_id: str, token: str) -> Generator[dict]:
+    Args:
+        week_harvest: WeekHarvest object containing week and style information
+        bp_item_type: Type of items to collect (releases or tracks)
+
+    Yields:
+        Individual items from the API response, in page order
+    """
+    for _, items in fetch_bp_pages(week_harvest, bp_item_type):
+        yield from items
+
+
+def fetch_release_tracks(release_id: int) -> list[dict]:
     """
     Collects all tracks for a specific release from the Beatport API.
 
     Args:
         release_id: ID of the release to get tracks for
-        token: Beatport API token
 
-    Yields:
-        Individual track items from the API response
-    """
-    logger.info(f"Collecting tracks for release {release_id} :: Starting")
+    Returns:
+        Track items of the release
 
+    Raises:
+        BPApiError: If a page could not be fetched after all retries
+    """
     url = f"{settings.bp_api_url}/releases/{release_id}/tracks/"
     params = {
         "page": 1,
         "per_page": 100,
     }
-
-    max_retries = 3
-    retry_delay = 1
-
+    tracks = []
     while url:
-        for _ in range(max_retries):
-            tracks, url, params, failed = request_bp_api(url, params, token)
-            if not failed:
-                break
-            time.sleep(retry_delay)
-        else:
-            logger.error(f"Failed to get tracks for release {release_id}")
-            break
+        try:
+            one_page = request_bp_page(url, params)
+        except BPApiError as e:
+            raise BPApiError(
+                f"Failed to collect tracks for release {release_id}"
+            ) from e
+        tracks.extend(one_page["results"])
+        url, params = one_page["next"], {}
+    logger.info("Got %s tracks for release %s", len(tracks), release_id)
+    return tracks
 
-        yield from tracks
 
-    logger.info(f"Collecting tracks for release {release_id} :: Done")
+def fetch_releases_tracks(release_ids: list[int]) -> Generator[tuple[int, list[dict]]]:
+    """
+    Collects the tracks of several releases on a pool of `bp_concurrency`
+    workers.
+
+    Yields:
+        Release ID and its tracks, in input order
+    """
+    with ThreadPoolExecutor(
+        max_workers=settings.bp_concurrency, thread_name_prefix="bp"
+    ) as executor:
+        results = executor.map(propagate_metrics(fetch_release_tracks), release_ids)
+        yield from zip(release_ids, results, strict=True)
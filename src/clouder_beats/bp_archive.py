@@ -0,0 +1,116 @@
+"""
+Archive of raw Beatport pages.
+
+Every page is stored once, gzip compressed and named after the SHA-256 of its
+content, so identical pages fetched by several harvests share one file:
+
+    <bp_archive_dir>/objects/ab/abcdef....json.gz
+    <bp_archive_dir>/manifests/<clouder_week>/<item_type>.json
+
+The manifest of a week and item type maps each page number to its object,
+which lets the harvest be replayed from disk without calling the API.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+from collections.abc import Generator
+
+from src.clouder_beats.config import settings
+from src.clouder_beats.week_harvest import WeekHarvest
+
+logger = logging.getLogger("bp")
+
+_manifest_lock = threading.Lock()
+
+
+class ArchiveMissError(LookupError):
+    """The archive does not hold every page of the requested harvest."""
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _object_path(content_hash: str) -> str:
+    return os.path.join(
+        settings.bp_archive_dir,
+        "objects",
+        content_hash[:2],
+        f"{content_hash}.json.gz",
+    )
+
+
+def _manifest_path(week_harvest: WeekHarvest, item_type: str) -> str:
+    return os.path.join(
+        settings.bp_archive_dir,
+        "manifests",
+        week_harvest.clouder_week,
+        f"{item_type}.json",
+    )
+
+
+def _read_manifest(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def archive_bp_page(
+    week_harvest: WeekHarvest, item_type: str, page: int, per_page: int, raw: dict
+):
+    """
+    Stores one raw API page and records it in the manifest of the week.
+    """
+    data = json.dumps(raw, sort_keys=True, separators=(",", ":")).encode()
+    content_hash = hashlib.sha256(data).hexdigest()
+    object_path = _object_path(content_hash)
+    if not os.path.exists(object_path):
+        _write_atomic(object_path, gzip.compress(data))
+
+    manifest_path = _manifest_path(week_harvest, item_type)
+    with _manifest_lock:
+        manifest = _read_manifest(manifest_path) or {
+            "clouder_week": week_harvest.clouder_week,
+            "item_type": item_type,
+            "per_page": per_page,
+            "pages": {},
+        }
+        manifest["count"] = raw["count"]
+        manifest["pages"][str(page)] = content_hash
+        _write_atomic(manifest_path, json.dumps(manifest, indent=2).encode())
+
+
+def replay_bp_pages(
+    week_harvest: WeekHarvest, item_type: str, start_page: int = 1
+) -> Generator[tuple[int, dict]]:
+    """
+    Yields the archived raw pages of a week from `start_page` on.
+
+    Raises:
+        ArchiveMissError: If the week was never archived or a page is missing
+    """
+    if not settings.bp_archive_dir:
+        raise ArchiveMissError("Replaying Beatport pages needs BP_ARCHIVE_DIR")
+    manifest = _read_manifest(_manifest_path(week_harvest, item_type))
+    if manifest is None:
+        raise ArchiveMissError(f"No archived {item_type} for {week_harvest}")
+    last_page = max(math.ceil(manifest["count"] / manifest["per_page"]), 1)
+    logger.info("Replaying %s for %s :: %s pages", item_type, week_harvest, last_page)
+    for page in range(start_page, last_page + 1):
+        content_hash = manifest["pages"].get(str(page))
+        if content_hash is None:
+            raise ArchiveMissError(
+                f"Page {page} of {item_type} for {week_harvest} is not archived"
+            )
+        with gzip.open(_object_path(content_hash)) as f:
+            yield page, json.load(f)
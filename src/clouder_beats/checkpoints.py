@@ -0,0 +1,85 @@
+import logging
+from datetime import UTC, datetime
+from enum import Enum
+
+from src.clouder_beats.mongo_adapter import get_data, save_data_mongo_by_id
+from src.clouder_beats.week_harvest import WeekHarvest
+
+logger = logging.getLogger("collectors")
+
+STAGES_COLLECTION = "harvest_stages"
+
+CHECKPOINT_FIELDS = ("bp_page", "streamed", "last_bp_id", "last_isrc")
+
+
+class StageStatus(Enum):
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+def _stage_id(week_harvest: WeekHarvest, stage: str) -> str:
+    return f"{week_harvest.clouder_week}:{stage}"
+
+
+def get_stage_state(week_harvest: WeekHarvest, stage: str) -> dict | None:
+    """Returns the stored state of a week's stage, if it ever ran."""
+    states = get_data(STAGES_COLLECTION, {"id": _stage_id(week_harvest, stage)})
+    return states[0] if states else None
+
+
+def save_stage_state(
+    week_harvest: WeekHarvest,
+    stage: str,
+    status: StageStatus | None = None,
+    **checkpoint,
+):
+    """
+    Stores the status and/or checkpoint fields of a week's stage.
+
+    Fields that are not passed keep their stored values.
+    """
+    unknown = set(checkpoint) - set(CHECKPOINT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown checkpoint fields: {sorted(unknown)}")
+    state = {
+        "id": _stage_id(week_harvest, stage),
+        "clouder_week": week_harvest.clouder_week,
+        "stage": stage,
+        "updated_at": datetime.now(UTC),
+        **checkpoint,
+    }
+    if status is not None:
+        state["status"] = status.value
+    save_data_mongo_by_id([state], STAGES_COLLECTION)
+
+
+def start_stage(
+    week_harvest: WeekHarvest, stage: str, force: bool = False
+) -> dict | None:
+    """
+    Marks a stage as running and returns the checkpoint to resume from.
+
+    Returns None for a stage that is already done, so it can be skipped.
+    An interrupted stage resumes from its last checkpoint. Otherwise, or
+    with `force`, the checkpoint is cleared and the stage starts over.
+    """
+    state = None if force else get_stage_state(week_harvest, stage)
+    if state and state.get("status") == StageStatus.DONE.value:
+        return None
+    if state:
+        checkpoint = {
+            field: state[field]
+            for field in CHECKPOINT_FIELDS
+            if state.get(field) is not None
+        }
+        logger.info("%s Resuming stage %s :: %s", week_harvest, stage, checkpoint)
+        save_stage_state(week_harvest, stage, StageStatus.RUNNING)
+        return checkpoint
+    save_stage_state(
+        week_harvest,
+        stage,
+        StageStatus.RUNNING,
+        **dict.fromkeys(CHECKPOINT_FIELDS),
+    )
+    return {}
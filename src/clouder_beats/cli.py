@@ -0,0 +1,372 @@
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Annotated
+
+import typer
+
+from src.clouder_beats.config import settings
+from src.clouder_beats.limits import Resource, configure_limits
+from src.clouder_beats.logging_config import setup_logging
+from src.clouder_beats.week_harvest import STYLES, WeekHarvest
+
+# The pipeline modules pull in requests, spotipy and pymongo, so commands
+# import them when they run rather than on every start of the CLI.
+
+logger = logging.getLogger("main")
+
+app = typer.Typer(no_args_is_help=True)
+
+
+@app.callback()
+def cli(ctx: typer.Context):
+    """Clouder Beats harvesting commands."""
+    help_requested = any(arg in ctx.help_option_names for arg in sys.argv[1:])
+    if ctx.resilient_parsing or help_requested:
+        # Help and completion run no command, so they read no settings
+        return
+    if settings.env == "dev":
+        from dotenv import load_dotenv
+
+        load_dotenv()
+    setup_logging()
+
+
+def parse_numbers(value: str) -> list[int]:
+    """Parses a list of numbers and ranges such as '1-4,7,10-12'."""
+    numbers = []
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (int(bound) for bound in part.split("-", 1))
+            if start > end:
+                raise typer.BadParameter(f"Range {part} is reversed")
+            numbers.extend(range(start, end + 1))
+        else:
+            numbers.append(int(part))
+    return list(dict.fromkeys(numbers))
+
+
+def parse_styles(value: str) -> list[int]:
+    """Parses style IDs or names, or 'all' for every known style."""
+    if value.strip().lower() == "all":
+        return list(STYLES)
+    style_ids = {name: style_id for style_id, name in STYLES.items()}
+    styles = []
+    for part in value.split(","):
+        part = part.strip().lower()
+        if part.isdigit() and int(part) in STYLES:
+            styles.append(int(part))
+        elif part in style_ids:
+            styles.append(style_ids[part])
+        else:
+            raise typer.BadParameter(f"Unknown style '{part}'")
+    return list(dict.fromkeys(styles))
+
+
+def build_harvests(
+    weeks: list[int], years: list[int], styles: list[int]
+) -> list[WeekHarvest]:
+    harvests = []
+    for year in years:
+        for week in weeks:
+            for style_id in styles:
+                try:
+                    harvests.append(WeekHarvest(week, year, style_id))
+                except ValueError as e:
+                    logger.warning("Skipping week %s of %s :: %s", week, year, e)
+                    break
+    return harvests
+
+
+def parse_stages(values: list[str]) -> set[str]:
+    """Validates stage names, 'all' selects every stage."""
+    from src.clouder_beats.collectors import STAGES
+
+    if "all" in values:
+        return set(STAGES)
+    unknown = set(values) - set(STAGES)
+    if unknown:
+        raise typer.BadParameter(
+            f"Unknown stages {sorted(unknown)}, expected one of {list(STAGES)}"
+        )
+    return set(values)
+
+
+def run_harvest(
+    week_harvest: WeekHarvest,
+    force: set[str],
+    streaming: bool = False,
+    releases: bool = False,
+    incremental: bool = False,
+) -> dict:
+    from src.clouder_beats.collectors import handle_clouder_week
+
+    started = time.monotonic()
+    try:
+        handle_clouder_week(
+            week_harvest,
+            force=force,
+            streaming=streaming,
+            releases=releases,
+            incremental=incremental,
+        )
+        status, error = "done", ""
+    except Exception as e:
+        logger.exception("Processing week %s :: Failed", week_harvest)
+        status, error = "failed", str(e)
+    return {
+        "week": week_harvest.clouder_week,
+        "status": status,
+        "seconds": time.monotonic() - started,
+        "error": error,
+    }
+
+
+def print_summary(results: list[dict]):
+    width = max([len("week")] + [len(result["week"]) for result in results])
+    typer.echo(f"{'week':<{width}}  {'status':<6}  {'seconds':>8}  error")
+    for result in results:
+        typer.echo(
+            f"{result['week']:<{width}}  {result['status']:<6}  "
+            f"{result['seconds']:>8.1f}  {result['error']}"
+        )
+    failed = sum(result["status"] == "failed" for result in results)
+    typer.echo(f"{len(results)} harvests, {failed} failed")
+
+
+@app.command()
+def harvest(
+    weeks: str = typer.Option(..., help="Weeks to harvest, e.g. '1-10,12'"),
+    years: str = typer.Option(..., help="Years to harvest, e.g. '2024-2025'"),
+    styles: str = typer.Option("all", help="Style IDs or names, or 'all'"),
+    workers: int = typer.Option(4, min=1, help="Harvests processed at once"),
+    bp_limit: int = typer.Option(2, min=1, help="Harvests using Beatport at once"),
+    sp_limit: int = typer.Option(2, min=1, help="Harvests using Spotify at once"),
+    mongo_limit: int = typer.Option(8, min=1, help="Concurrent Mongo operations"),
+    force: Annotated[
+        list[str] | None,
+        typer.Option(help="Stage to run again even if done, or 'all'"),
+    ] = None,
+    archive_dir: Annotated[
+        str | None,
+        typer.Option(help="Archive raw Beatport pages in this directory"),
+    ] = None,
+    replay: bool = typer.Option(
+        False, help="Read Beatport pages from the archive instead of the API"
+    ),
+    streaming: bool = typer.Option(
+        False, help="Resolve Spotify tracks while Beatport pages download"
+    ),
+    releases: bool = typer.Option(
+        False, help="Also collect the tracks of the week's releases"
+    ),
+    incremental: bool = typer.Option(
+        False, help="Only collect tracks published since the last harvest"
+    ),
+):
+    """
+    Harvests every combination of the given weeks, years and styles.
+
+    Stages that are already done are skipped and interrupted ones resume
+    from their checkpoint.
+    """
+    harvests = build_harvests(
+        parse_numbers(weeks), parse_numbers(years), parse_styles(styles)
+    )
+    forced_stages = parse_stages(force or [])
+    if not harvests:
+        raise typer.BadParameter("Nothing to harvest")
+    if archive_dir:
+        settings.bp_archive_dir = archive_dir
+    if replay:
+        if not settings.bp_archive_dir:
+            raise typer.BadParameter("--replay needs --archive-dir or BP_ARCHIVE_DIR")
+        settings.bp_replay = True
+    configure_limits(
+        {
+            Resource.BEATPORT: bp_limit,
+            Resource.SPOTIFY: sp_limit,
+            Resource.MONGO: mongo_limit,
+        }
+    )
+    from src.clouder_beats.bp_adapter import close_bp_session
+    from src.clouder_beats.indexes import ensure_indexes
+    from src.clouder_beats.mongo_adapter import close_mongo_client
+    from src.clouder_beats.sp_adapter import close_sp
+
+    logger.info("Processing %s harvests :: Starting", len(harvests))
+    try:
+        ensure_indexes()
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="harvest"
+        ) as executor:
+            results = list(
+                executor.map(
+                    partial(
+                        run_harvest,
+                        force=forced_stages,
+                        streaming=streaming,
+                        releases=releases,
+                        incremental=incremental,
+                    ),
+                    harvests,
+                )
+            )
+    finally:
+        close_bp_session()
+        close_sp()
+        close_mongo_client()
+    logger.info("Processing %s harvests :: Done", len(harvests))
+    print_summary(results)
+    if any(result["status"] == "failed" for result in results):
+        raise typer.Exit(code=1)
+
+
+@app.command("ensure-indexes")
+def ensure_indexes_command():
+    """Creates the indexes of every harvest collection."""
+    from src.clouder_beats.indexes import ensure_indexes
+    from src.clouder_beats.mongo_adapter import close_mongo_client
+
+    try:
+        ok = ensure_indexes()
+    finally:
+        close_mongo_client()
+    if not ok:
+        raise typer.Exit(code=1)
+
+
+@app.command("check-indexes")
+def check_indexes_command(
+    week: int = typer.Option(1, help="Week used to build the sample queries"),
+    year: int = typer.Option(2025, help="Year used to build the sample queries"),
+    style: str = typer.Option("dnb", help="Style ID or name"),
+):
+    """Explains the pipeline queries and flags collection scans."""
+    from src.clouder_beats.indexes import check_indexes
+    from src.clouder_beats.mongo_adapter import close_mongo_client
+
+    week_harvest = WeekHarvest(week, year, parse_styles(style)[0])
+    try:
+        collscans = check_indexes(week_harvest)
+    finally:
+        close_mongo_client()
+    for collection, query in collscans:
+        typer.echo(f"COLLSCAN  {collection}  {query}")
+    if collscans:
+        raise typer.Exit(code=1)
+    typer.echo("No collection scans")
+
+
+@app.command("migrate-track-store")
+def migrate_track_store_command(
+    batch_size: int = typer.Option(1000, min=1, help="Tracks written per batch"),
+):
+    """Merges per-week track documents into one document per track."""
+    from src.clouder_beats.migrations import migrate_track_store
+    from src.clouder_beats.mongo_adapter import close_mongo_client
+
+    try:
+        migrated = migrate_track_store(batch_size)
+    finally:
+        close_mongo_client()
+    for collection, count in migrated.items():
+        typer.echo(f"{collection}  {count} tracks migrated")
+
+
+@app.command()
+def enqueue(
+    weeks: str = typer.Option(..., help="Weeks to harvest, e.g. '1-10,12'"),
+    years: str = typer.Option(..., help="Years to harvest, e.g. '2024-2025'"),
+    styles: str = typer.Option("all", help="Style IDs or names, or 'all'"),
+    force: Annotated[
+        list[str] | None,
+        typer.Option(help="Stage to run again even if done, or 'all'"),
+    ] = None,
+    releases: bool = typer.Option(
+        False, help="Also collect the tracks of the week's releases"
+    ),
+):
+    """Queues harvests for the workers started with the 'worker' command."""
+    harvests = build_harvests(
+        parse_numbers(weeks), parse_numbers(years), parse_styles(styles)
+    )
+    forced_stages = parse_stages(force or [])
+    if not harvests:
+        raise typer.BadParameter("Nothing to harvest")
+    from src.clouder_beats.indexes import ensure_indexes
+    from src.clouder_beats.jobs import enqueue_harvest
+    from src.clouder_beats.mongo_adapter import close_mongo_client
+
+    try:
+        ensure_indexes()
+        queued = sum(
+            enqueue_harvest(week_harvest, forced_stages, releases)
+            for week_harvest in harvests
+        )
+    finally:
+        close_mongo_client()
+    typer.echo(f"{queued} harvests queued, {len(harvests) - queued} already queued")
+
+
+@app.command()
+def worker(
+    workers: int = typer.Option(1, min=1, help="Jobs processed at once"),
+    worker_id: Annotated[
+        str | None, typer.Option(help="Name of this worker, host:pid by default")
+    ] = None,
+    drain: bool = typer.Option(False, help="Exit once the queue is empty"),
+    bp_limit: int = typer.Option(2, min=1, help="Jobs using Beatport at once"),
+    sp_limit: int = typer.Option(2, min=1, help="Jobs using Spotify at once"),
+    mongo_limit: int = typer.Option(8, min=1, help="Concurrent Mongo operations"),
+):
+    """Claims and runs queued harvest stages until interrupted."""
+    # Nobody is there to answer a token prompt
+    settings.interactive = False
+    configure_limits(
+        {
+            Resource.BEATPORT: bp_limit,
+            Resource.SPOTIFY: sp_limit,
+            Resource.MONGO: mongo_limit,
+        }
+    )
+    from src.clouder_beats.bp_adapter import close_bp_session
+    from src.clouder_beats.indexes import ensure_indexes
+    from src.clouder_beats.jobs import default_worker_id, run_worker
+    from src.clouder_beats.mongo_adapter import close_mongo_client
+    from src.clouder_beats.sp_adapter import close_sp
+
+    worker_id = worker_id or default_worker_id()
+    stop = threading.Event()
+    try:
+        ensure_indexes()
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="worker"
+        ) as executor:
+            futures = [
+                executor.submit(run_worker, f"{worker_id}:{index}", stop, drain)
+                for index in range(workers)
+            ]
+            try:
+                results = [future.result() for future in futures]
+            except KeyboardInterrupt:
+                logger.warning(
+                    "Worker %s :: Stopping after the running jobs", worker_id
+                )
+                stop.set()
+                results = [future.result() for future in futures]
+    finally:
+        close_bp_session()
+        close_sp()
+        close_mongo_client()
+    failed = sum(result["failed"] for result in results)
+    done = sum(result["done"] for result in results)
+    typer.echo(f"{done} jobs done, {failed} attempts failed")
+    if failed:
+        raise typer.Exit(code=1)
@@ -1,106 +1,461 @@
 import logging
+import math
+from collections.abc import Collection
 from itertools import batched
 
-from src.clouder_beats.bp_adapter import BPItemType, fetch_bp_items
+from src.clouder_beats.bp_adapter import (
+    BPItemType,
+    fetch_bp_pages,
+    fetch_releases_tracks,
+)
+from src.clouder_beats.checkpoints import StageStatus, save_stage_state, start_stage
 from src.clouder_beats.config import settings
-from src.clouder_beats.mongo_adapter import get_data, save_data_mongo_by_id
+from src.clouder_beats.isrc_cache import prefetch_isrc_cache, store_isrc_cache
+from src.clouder_beats.limits import Resource, limit
+from src.clouder_beats.mongo_adapter import (
+    add_to_set_many,
+    aggregate_data,
+    get_data,
+    iter_data,
+    save_data_mongo_by_id,
+)
+from src.clouder_beats.pipeline import run_pipeline
+from src.clouder_beats.projection import project, project_documents
 from src.clouder_beats.sp_adapter import (
     add_tracks_to_playlist,
     create_playlist,
-    get_track_by_isrc,
+    get_tracks_by_isrc,
+    sync_playlist_tracks,
 )
 from src.clouder_beats.statistics import StatisticEnum, track_statistics
+from src.clouder_beats.watermarks import (
+    get_watermark,
+    is_past_watermark,
+    update_watermark,
+)
 from src.clouder_beats.week_harvest import WeekHarvest
 
 logger = logging.getLogger("collectors")
 
 
 def save_clouder_week(week_harvest: WeekHarvest):
-    save_data_mongo_by_id(week_harvest.data_to_mongo(), "clouder_weeks", ["week"])
+    save_data_mongo_by_id(
+        week_harvest.data_to_mongo(), "clouder_weeks", ["id"], raise_errors=True
+    )
 
 
 @track_statistics(StatisticEnum.BEATPORT)
-def collect_bp_items(week_harvest: WeekHarvest, bp_item_type: BPItemType) -> dict:
-    logger.info(f"Collecting {bp_item_type.value} for {week_harvest} :: Starting")
-    items = fetch_bp_items(week_harvest, bp_item_type)
+def collect_bp_items(
+    week_harvest: WeekHarvest, bp_item_type: BPItemType, start_page: int = 1
+) -> dict:
+    logger.info("Collecting %s for %s :: Starting", bp_item_type.value, week_harvest)
+    stage = f"bp_{bp_item_type.value}"
     statistic = {
         "full_cnt": 0,
         "inserted": 0,
         "updated": 0,
+        "unchanged": 0,
     }
-    for chunk in batched(items, settings.bp_chunk_size):
-        statistic["full_cnt"] += len(chunk)
-        for el in chunk:
-            el["clouder_week"] = week_harvest.clouder_week
-        try:
-            chunk_inserted, chunk_updated = save_data_mongo_by_id(
-                chunk, f"bp_{bp_item_type.value}", key_fields=["id", "clouder_week"]
+    for page, items in fetch_bp_pages(week_harvest, bp_item_type, start_page):
+        for chunk in batched(items, settings.bp_chunk_size):
+            statistic["full_cnt"] += len(chunk)
+            chunk_inserted, chunk_updated, chunk_unchanged = save_data_mongo_by_id(
+                project_documents(stage, chunk),
+                stage,
+                add_to_set=week_harvest.track_membership,
+                raise_errors=True,
             )
             statistic["inserted"] += chunk_inserted
             statistic["updated"] += chunk_updated
-        except Exception as e:
-            logger.error(f"Failed to save BP {bp_item_type.value} :: {e}")
-            raise
-    logger.info(f"{week_harvest} Saved {bp_item_type.value} :: {statistic}")
+            statistic["unchanged"] += chunk_unchanged
+        save_stage_state(week_harvest, stage, bp_page=page, streamed=False)
+    logger.info("%s Saved %s :: %s", week_harvest, bp_item_type.value, statistic)
     return statistic
 
 
-def collect_bp_tracks(week_harvest: WeekHarvest):
-    collect_bp_items(week_harvest, bp_item_type=BPItemType.TRACK)
+def collect_bp_tracks(week_harvest: WeekHarvest, checkpoint: dict | None = None):
+    start_page = (checkpoint or {}).get("bp_page", 0) + 1
+    collect_bp_items(week_harvest, bp_item_type=BPItemType.TRACK, start_page=start_page)
 
 
-@track_statistics(StatisticEnum.SPOTIFY)
-def collect_sp_tracks(week_harvest: WeekHarvest):
-    logger.info(f"Collecting Spotify tracks for {week_harvest} :: Starting")
-    filters = {"clouder_week": week_harvest.clouder_week}
-    fields = ["id", "isrc", "genre.id"]
-    bp_tracks = get_data("bp_tracks", filters, fields)
-    full_cnt, found, is_genre = len(bp_tracks), 0, 0
+def _stored_releases_pipeline(release_ids: list[int]) -> list[dict]:
+    """Returns the bp_tracks pipeline that counts the stored tracks of releases."""
+    return [
+        {"$match": {"release.id": {"$in": release_ids}}},
+        {"$group": {"_id": "$release.id", "count": {"$sum": 1}}},
+    ]
+
+
+def _stored_releases(releases: list[dict]) -> set[int]:
+    """Returns the IDs of the releases whose tracks are all in bp_tracks."""
+    stored_counts = {
+        group["_id"]: group["count"]
+        for group in aggregate_data(
+            "bp_tracks", _stored_releases_pipeline([r["id"] for r in releases])
+        )
+    }
+    return {
+        release["id"]
+        for release in releases
+        if release["id"] in stored_counts
+        and stored_counts[release["id"]] >= release.get("track_count", math.inf)
+    }
+
+
+@track_statistics(StatisticEnum.BEATPORT_RELEASES)
+def collect_bp_release_tracks(
+    week_harvest: WeekHarvest, checkpoint: dict | None = None
+) -> dict:
+    """
+    Collects the tracks of the week's releases, which catches tracks the
+    week's track query misses.
+
+    Releases whose tracks are all stored already are only added to the week.
+    The tracks of the others are fetched concurrently, one release per
+    worker, and saved in chunks of `bp_chunk_size`.
+    """
+    logger.info("Collecting release tracks for %s :: Starting", week_harvest)
+    start_page = (checkpoint or {}).get("bp_page", 0) + 1
+    membership = week_harvest.track_membership
+    statistic = dict.fromkeys(
+        ("releases", "skipped", "full_cnt", "inserted", "updated", "unchanged"), 0
+    )
+
+    def save_tracks(tracks: list[dict]):
+        inserted, updated, unchanged = save_data_mongo_by_id(
+            project_documents("bp_tracks", tracks),
+            "bp_tracks",
+            add_to_set=membership,
+            raise_errors=True,
+        )
+        statistic["full_cnt"] += len(tracks)
+        statistic["inserted"] += inserted
+        statistic["updated"] += updated
+        statistic["unchanged"] += unchanged
+
+    pages = fetch_bp_pages(week_harvest, BPItemType.RELEASE, start_page)
+    for page, releases in pages:
+        stored = _stored_releases(releases)
+        if stored:
+            add_to_set_many(
+                "bp_tracks", {"release.id": {"$in": list(stored)}}, membership
+            )
+        missing = [release["id"] for release in releases if release["id"] not in stored]
+        tracks = []
+        for _, release_tracks in fetch_releases_tracks(missing):
+            tracks.extend(release_tracks)
+            if len(tracks) >= settings.bp_chunk_size:
+                save_tracks(tracks)
+                tracks = []
+        if tracks:
+            save_tracks(tracks)
+        statistic["releases"] += len(releases)
+        statistic["skipped"] += len(stored)
+        save_stage_state(week_harvest, "bp_releases", bp_page=page)
+        logger.info(
+            "%s Got release tracks :: page %s : %s fetched, %s skipped",
+            week_harvest,
+            page,
+            len(missing),
+            len(stored),
+        )
+    logger.info("%s Saved release tracks :: %s", week_harvest, statistic)
+    return statistic
+
+
+def _strip_markets(sp_track: dict | None) -> dict | None:
+    if sp_track:
+        sp_track.pop("available_markets", None)
+        sp_track["album"].pop("available_markets", None)
+    return sp_track
+
+
+def resolve_sp_chunk(
+    week_harvest: WeekHarvest, bp_tracks: list[dict]
+) -> tuple[list[dict], list[str], dict]:
+    """
+    Resolves the Spotify tracks for one chunk of Beatport tracks.
+
+    Tracks already resolved for any week are only looked up in sp_tracks,
+    the others go through the ISRC cache and Spotify search.
+
+    Returns:
+        The Spotify tracks to save, the IDs of the already stored ones and
+        the resolution counts of the chunk
+    """
+    known = {
+        sp_track["bp_id"]: sp_track["id"]
+        for sp_track in get_data(
+            "sp_tracks",
+            {"bp_id": {"$in": [bp_track["id"] for bp_track in bp_tracks]}},
+            ["id", "bp_id"],
+        )
+    }
+    isrcs = [bp_track["isrc"] for bp_track in bp_tracks if bp_track["id"] not in known]
+    resolved = prefetch_isrc_cache(isrcs)
+    missing = [isrc for isrc in dict.fromkeys(isrcs) if isrc not in resolved]
+    searched = {
+        isrc: project("sp_tracks", _strip_markets(sp_track))
+        for isrc, sp_track in get_tracks_by_isrc(missing)
+    }
+    store_isrc_cache(searched)
+    resolved.update(searched)
+
+    found, is_genre = 0, 0
     sp_tracks = []
     for bp_track in bp_tracks:
-        sp_track = get_track_by_isrc(bp_track["isrc"])
-        if sp_track:
-            if "available_markets" in sp_track:
-                sp_track.pop("available_markets", None)
-            album_info = sp_track["album"]
-            if "available_markets" in album_info:
-                album_info.pop("available_markets", None)
-            sp_track["bp_id"] = bp_track["id"]
-            sp_track["clouder_week"] = week_harvest.clouder_week
-            if "genre" in bp_track:
-                sp_track["bp_genre_id"] = bp_track["genre"]["id"]
-                if sp_track["bp_genre_id"] == week_harvest.style_id:
-                    is_genre += 1
+        genre_id = bp_track["genre"]["id"] if "genre" in bp_track else None
+        if bp_track["id"] in known:
+            found += 1
+        elif sp_track := resolved[bp_track["isrc"]]:
+            sp_track = {**sp_track, "bp_id": bp_track["id"]}
+            if genre_id is not None:
+                sp_track["bp_genre_id"] = genre_id
             sp_tracks.append(sp_track)
             found += 1
-            if len(sp_tracks) % 10 == 0:
-                logger.info(
-                    f"{week_harvest} Got Spotify tracks :: {found} / {full_cnt}"
-                )
+        else:
+            continue
+        if genre_id == week_harvest.style_id:
+            is_genre += 1
+
+    return (
+        project_documents("sp_tracks", sp_tracks),
+        list(known.values()),
+        {
+            "full_cnt": len(bp_tracks),
+            "found": found,
+            "not_found": len(bp_tracks) - found,
+            "known": len(known),
+            "searched": len(missing),
+            "is_genre": is_genre,
+            "not_genre": found - is_genre,
+        },
+    )
+
+
+def save_sp_tracks(
+    week_harvest: WeekHarvest, sp_tracks: list[dict], known_ids: list[str]
+) -> dict:
+    """
+    Saves the resolved Spotify tracks and adds the week to the known ones.
+    """
+    membership = week_harvest.track_membership
+    inserted, updated, unchanged = save_data_mongo_by_id(
+        sp_tracks, "sp_tracks", add_to_set=membership, raise_errors=True
+    )
+    if known_ids:
+        add_to_set_many("sp_tracks", {"id": {"$in": known_ids}}, membership)
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": unchanged + len(known_ids),
+    }
+
+
+def collect_sp_chunk(week_harvest: WeekHarvest, bp_tracks: list[dict]) -> dict:
+    """Resolves and saves the Spotify tracks for one chunk of Beatport tracks"""
+    sp_tracks, known_ids, statistic = resolve_sp_chunk(week_harvest, bp_tracks)
+    return {**statistic, **save_sp_tracks(week_harvest, sp_tracks, known_ids)}
 
-    save_data_mongo_by_id(sp_tracks, "sp_tracks", key_fields=["id", "clouder_week"])
 
+def _week_tracks_filter(week_harvest: WeekHarvest, last_bp_id: int | None) -> dict:
+    """Returns the bp_tracks filter of the week's tracks after `last_bp_id`."""
+    filters = dict(week_harvest.track_membership)
+    if last_bp_id is not None:
+        filters["id"] = {"$gt": last_bp_id}
+    return filters
+
+
+@track_statistics(StatisticEnum.SPOTIFY)
+def collect_sp_tracks(week_harvest: WeekHarvest, checkpoint: dict | None = None):
+    logger.info("Collecting Spotify tracks for %s :: Starting", week_harvest)
+    last_bp_id = (checkpoint or {}).get("last_bp_id")
+    fields = ["id", "isrc", "genre.id"]
+    bp_tracks = iter_data(
+        "bp_tracks",
+        _week_tracks_filter(week_harvest, last_bp_id),
+        fields,
+        query_sort=[("id", 1)],
+        batch_size=settings.sp_chunk_size,
+    )
     statistics = {
-        "full_cnt": full_cnt,
-        "found": found,
-        "not_found": full_cnt - found,
-        "is_genre": is_genre,
-        "not_genre": found - is_genre,
+        "full_cnt": 0,
+        "found": 0,
+        "not_found": 0,
+        "known": 0,
+        "searched": 0,
+        "is_genre": 0,
+        "not_genre": 0,
+        "inserted": 0,
+        "updated": 0,
+        "unchanged": 0,
     }
-    logger.info(f"{week_harvest} Got Spotify tracks :: {statistics}")
+    for chunk in batched(bp_tracks, settings.sp_chunk_size):
+        chunk_statistics = collect_sp_chunk(week_harvest, list(chunk))
+        for key, value in chunk_statistics.items():
+            statistics[key] += value
+        save_stage_state(
+            week_harvest,
+            "sp_tracks",
+            last_bp_id=chunk[-1]["id"],
+            last_isrc=chunk[-1]["isrc"],
+        )
+        logger.info(
+            "%s Got Spotify tracks :: %s / %s",
+            week_harvest,
+            statistics["found"],
+            statistics["full_cnt"],
+        )
+
+    logger.info("%s Got Spotify tracks :: %s", week_harvest, statistics)
     return statistics
 
 
+def is_streamed(checkpoint: dict) -> bool:
+    """
+    Tells whether the pages before a bp_tracks checkpoint were streamed, so
+    their tracks are resolved on Spotify too.
+
+    Checkpoints saved before the flag existed are taken as not streamed.
+    """
+    return checkpoint.get("streamed", "bp_page" not in checkpoint)
+
+
+@track_statistics(StatisticEnum.PIPELINE)
+def stream_tracks(week_harvest: WeekHarvest, checkpoint: dict | None = None) -> dict:
+    """
+    Collects the Beatport tracks of a week and their Spotify tracks in one
+    overlapped pipeline.
+
+    While later pages are still downloading, each page is resolved on
+    Spotify by one thread and both collections are written by another. The
+    page checkpoint is saved once both collections hold the page. It stays
+    marked as not streamed if the stream resumed from a checkpoint that was
+    not.
+    """
+    logger.info("Streaming tracks for %s :: Starting", week_harvest)
+    checkpoint = checkpoint or {}
+    start_page = checkpoint.get("bp_page", 0) + 1
+    streamed = is_streamed(checkpoint)
+    statistic = {
+        "beatport": dict.fromkeys(("full_cnt", "inserted", "updated", "unchanged"), 0),
+        "spotify": dict.fromkeys(
+            (
+                "full_cnt",
+                "found",
+                "not_found",
+                "known",
+                "searched",
+                "is_genre",
+                "not_genre",
+                "inserted",
+                "updated",
+                "unchanged",
+            ),
+            0,
+        ),
+    }
+
+    def add(totals: dict, counts: dict):
+        for key, value in counts.items():
+            totals[key] += value
+
+    def read_pages():
+        pages = fetch_bp_pages(week_harvest, BPItemType.TRACK, start_page)
+        for page, items in pages:
+            yield page, project_documents("bp_tracks", items)
+
+    def resolve(bp_page: tuple[int, list[dict]]):
+        page, bp_tracks = bp_page
+        sp_tracks, known_ids, sp_statistic = resolve_sp_chunk(week_harvest, bp_tracks)
+        add(statistic["spotify"], sp_statistic)
+        return page, bp_tracks, sp_tracks, known_ids
+
+    def write(resolved_page: tuple[int, list[dict], list[dict], list[str]]):
+        page, bp_tracks, sp_tracks, known_ids = resolved_page
+        inserted, updated, unchanged = save_data_mongo_by_id(
+            bp_tracks,
+            "bp_tracks",
+            add_to_set=week_harvest.track_membership,
+            raise_errors=True,
+        )
+        add(
+            statistic["beatport"],
+            {
+                "full_cnt": len(bp_tracks),
+                "inserted": inserted,
+                "updated": updated,
+                "unchanged": unchanged,
+            },
+        )
+        add(statistic["spotify"], save_sp_tracks(week_harvest, sp_tracks, known_ids))
+        save_stage_state(week_harvest, "bp_tracks", bp_page=page, streamed=streamed)
+        logger.info(
+            "%s Streamed page %s :: %s / %s",
+            week_harvest,
+            page,
+            statistic["spotify"]["found"],
+            statistic["beatport"]["full_cnt"],
+        )
+
+    run_pipeline(read_pages(), resolve, write, queue_size=settings.pipeline_queue_size)
+    logger.info("%s Streamed tracks :: %s", week_harvest, statistic)
+    return statistic
+
+
+@track_statistics(StatisticEnum.REFRESH)
+def refresh_tracks(week_harvest: WeekHarvest, watermark: dict) -> dict:
+    """
+    Collects the tracks published since the week's watermark.
+
+    Pages are requested one at a time, newest first, until one reaches a
+    track published before the watermark date, and only the tracks from
+    that date on go on to Spotify. Those already resolved are only looked up
+    in sp_tracks.
+    """
+    logger.info("Refreshing tracks for %s :: Starting", week_harvest)
+    membership = week_harvest.track_membership
+    statistic = dict.fromkeys(("pages", "full_cnt", "inserted", "sp_cnt"), 0)
+    new_tracks = []
+    pages = fetch_bp_pages(week_harvest, BPItemType.TRACK, serial=True)
+    try:
+        for page, items in pages:
+            bp_tracks = project_documents("bp_tracks", items)
+            inserted, _, _ = save_data_mongo_by_id(
+                bp_tracks, "bp_tracks", add_to_set=membership, raise_errors=True
+            )
+            fresh = [
+                bp_track
+                for bp_track in bp_tracks
+                if not is_past_watermark(bp_track, watermark)
+            ]
+            new_tracks.extend(fresh)
+            statistic["pages"] = page
+            statistic["full_cnt"] += len(bp_tracks)
+            statistic["inserted"] += inserted
+            if len(fresh) < len(bp_tracks):
+                logger.info("%s Reached watermark on page %s", week_harvest, page)
+                break
+    finally:
+        pages.close()
+    statistic["sp_cnt"] = len(new_tracks)
+    statistic["spotify"] = dict.fromkeys(("found", "searched", "inserted"), 0)
+    for chunk in batched(new_tracks, settings.sp_chunk_size):
+        chunk_statistic = collect_sp_chunk(week_harvest, list(chunk))
+        for key in statistic["spotify"]:
+            statistic["spotify"][key] += chunk_statistic[key]
+    logger.info("%s Refreshed tracks :: %s", week_harvest, statistic)
+    return statistic
+
+
 def create_sp_playlists(week_harvest: WeekHarvest):
-    logger.info(f"Collecting Spotify playlists for {week_harvest} :: Starting")
+    logger.info("Collecting Spotify playlists for %s :: Starting", week_harvest)
     sp_playlists = []
     exists_playlists = get_data(
         "sp_playlists", {"clouder_week": week_harvest.clouder_week}
     )
     if exists_playlists:
-        logger.warning(
-            f"{week_harvest} Spotify playlists already exists"
-        )
+        logger.warning("%s Spotify playlists already exists", week_harvest)
         return
     for pl_type, pl_names in week_harvest.playlists.items():
         for pl_name in pl_names:
@@ -117,72 +472,208 @@ def create_sp_playlists(week_harvest: WeekHarvest):
                     }
                 )
             else:
-                logger.error(f"Failed to create Spotify playlist :: {sp_name}")
-    save_data_mongo_by_id(sp_playlists, "sp_playlists", key_fields=["playlist_id"])
-    logger.info(f"{week_harvest} Got Spotify playlists :: {len(sp_playlists)}")
-
-
-def populate_one_sp_pl(
-    week_harvest: WeekHarvest, pl_type: str, track_filters: dict
-) -> int:
-    logger.info(f"Populating Spotify playlists for {week_harvest} :: Starting")
-    pl_filters = {"clouder_week": week_harvest.clouder_week, "clouder_pl_name": pl_type}
-    pl_fields = ["playlist_id"]
-    sp_playlists = get_data("sp_playlists", pl_filters, pl_fields)
-    playlist_id = sp_playlists[0]["playlist_id"] if sp_playlists else None
-    if not playlist_id:
-        raise ValueError(f"Spotify playlist not found for '{pl_type}'")
-
-    query_sort = None
+                logger.error("Failed to create Spotify playlist :: %s", sp_name)
+    save_data_mongo_by_id(
+        sp_playlists, "sp_playlists", key_fields=["playlist_id"], raise_errors=True
+    )
+    logger.info("%s Got Spotify playlists :: %s", week_harvest, len(sp_playlists))
+
+
+def _playlist_tracks_pipeline(week_harvest: WeekHarvest) -> list[dict]:
+    """Returns the sp_tracks pipeline that buckets the week's playlist tracks."""
+    week_filter = dict(week_harvest.track_membership)
+    pipeline = [{"$match": week_filter}]
     if week_harvest.style_id != 1:
-        track_filters["popularity"] = {"$gt": 0}
-        query_sort = [("popularity", -1)]
-    sp_tracks = get_data("sp_tracks", track_filters, ["uri"], query_sort)
-    if sp_tracks:
-        uris = [track["uri"] for track in sp_tracks]
-        add_tracks_to_playlist(playlist_id, uris)
-        logger.info(
-            f"{week_harvest} Populated Spotify playlist '{pl_type}' :: {len(uris)}"
-        )
-        return len(uris)
-    else:
-        logger.warning(f"{week_harvest} Spotify tracks not found for '{pl_type}'")
-        return 0
+        week_filter["popularity"] = {"$gt": 0}
+        pipeline.append({"$sort": {"popularity": -1}})
+    pipeline.append(
+        {
+            "$facet": {
+                pl_type: [{"$match": track_filters}, {"$project": {"_id": 0, "uri": 1}}]
+                for pl_type, track_filters in week_harvest.playlist_filters.items()
+            }
+        }
+    )
+    return pipeline
 
 
-@track_statistics(StatisticEnum.SP_PLAYLIST)
-def populate_sp_playlists(week_harvest: WeekHarvest):
-    filters_new = {
+def _week_playlists_filter(week_harvest: WeekHarvest) -> dict:
+    """Returns the sp_playlists filter of the playlists the week populates."""
+    return {
         "clouder_week": week_harvest.clouder_week,
-        "bp_genre_id": week_harvest.style_id,
-        "album.release_date": {"$gte": week_harvest.sp_week_start},
+        "clouder_pl_name": {"$in": list(week_harvest.playlist_filters)},
     }
-    new_cnt = populate_one_sp_pl(week_harvest, "new", filters_new)
 
-    filters_old = {
-        "clouder_week": week_harvest.clouder_week,
-        "bp_genre_id": week_harvest.style_id,
-        "album.release_date": {"$lt": week_harvest.sp_week_start},
-    }
-    old_cnt = populate_one_sp_pl(week_harvest, "old", filters_old)
 
-    filters_not = {
-        "clouder_week": week_harvest.clouder_week,
-        "bp_genre_id": {"$ne": week_harvest.style_id},
-    }
-    not_cnt = populate_one_sp_pl(week_harvest, "not", filters_not)
-    return {
-        "new": new_cnt,
-        "old": old_cnt,
-        "not": not_cnt,
-    }
+@track_statistics(StatisticEnum.SP_PLAYLIST)
+def populate_sp_playlists(week_harvest: WeekHarvest):
+    logger.info("Populating Spotify playlists for %s :: Starting", week_harvest)
+    pl_filters = week_harvest.playlist_filters
+    sp_playlists = get_data(
+        "sp_playlists",
+        _week_playlists_filter(week_harvest),
+        ["playlist_id", "clouder_pl_name"],
+    )
+    playlist_ids = {pl["clouder_pl_name"]: pl["playlist_id"] for pl in sp_playlists}
+    for pl_type in pl_filters:
+        if pl_type not in playlist_ids:
+            raise ValueError(f"Spotify playlist not found for '{pl_type}'")
+
+    buckets = aggregate_data("sp_tracks", _playlist_tracks_pipeline(week_harvest))[0]
+
+    statistic = {}
+    for pl_type in pl_filters:
+        uris = [track["uri"] for track in buckets[pl_type]]
+        if settings.sp_playlist_sync:
+            sync_playlist_tracks(playlist_ids[pl_type], uris)
+        elif uris:
+            add_tracks_to_playlist(playlist_ids[pl_type], uris)
+        if uris:
+            logger.info(
+                "%s Populated Spotify playlist '%s' :: %s",
+                week_harvest,
+                pl_type,
+                len(uris),
+            )
+        else:
+            logger.warning(
+                "%s Spotify tracks not found for '%s'", week_harvest, pl_type
+            )
+        statistic[pl_type] = len(uris)
+    return statistic
 
 
-def handle_clouder_week(week_harvest: WeekHarvest):
-    logger.info(f"Processing week {week_harvest} :: Starting")
+STAGES = {
+    "bp_tracks": (collect_bp_tracks, Resource.BEATPORT, True),
+    "bp_releases": (collect_bp_release_tracks, Resource.BEATPORT, True),
+    "sp_tracks": (collect_sp_tracks, Resource.SPOTIFY, True),
+    "sp_playlists": (create_sp_playlists, Resource.SPOTIFY, False),
+    "sp_populate": (populate_sp_playlists, Resource.SPOTIFY, False),
+}
+
+STREAMED_STAGES = ("bp_tracks", "sp_tracks")
+
+OPTIONAL_STAGES = ("bp_releases",)
+
+
+def harvest_stages(releases: bool = False) -> list[str]:
+    """Returns the stages of a week in the order they run."""
+    return [stage for stage in STAGES if releases or stage not in OPTIONAL_STAGES]
+
+
+def run_stage(week_harvest: WeekHarvest, stage: str, force: bool = False):
+    """
+    Runs one stage of a week unless it is already done.
+
+    An interrupted stage resumes from its checkpoint, `force` runs it again
+    from the start.
+    """
+    func, resource, resumable = STAGES[stage]
+    checkpoint = start_stage(week_harvest, stage, force)
+    if checkpoint is None:
+        logger.info("%s Stage %s already done :: Skipping", week_harvest, stage)
+        return
+    try:
+        with limit(resource):
+            if resumable:
+                func(week_harvest, checkpoint)
+            else:
+                func(week_harvest)
+    except Exception:
+        save_stage_state(week_harvest, stage, StageStatus.FAILED)
+        raise
+    save_stage_state(week_harvest, stage, StageStatus.DONE)
+
+
+def run_streamed_stages(
+    week_harvest: WeekHarvest, force: bool = False, whole_week: bool = True
+):
+    """
+    Runs the bp_tracks and sp_tracks stages together with `stream_tracks`.
+
+    The stages share the Beatport page checkpoint. If the Beatport tracks
+    are already done there is nothing to overlap, and sp_tracks runs alone.
+    The stream only resolves the tracks it pages through, so unless
+    `whole_week` tells these are all the tracks of the week, and the stream
+    does not resume from the checkpoint of a run that was not streamed,
+    sp_tracks then makes its own pass over the week, where the streamed
+    tracks are only looked up in sp_tracks.
+    """
+    checkpoint = start_stage(week_harvest, "bp_tracks", force)
+    if checkpoint is None:
+        run_stage(week_harvest, "sp_tracks", force)
+        return
+    if not is_streamed(checkpoint):
+        logger.info(
+            "%s Resuming a run that was not streamed :: sp_tracks runs after",
+            week_harvest,
+        )
+        whole_week = False
+    start_stage(week_harvest, "sp_tracks", force=True)
+    try:
+        with limit(Resource.BEATPORT), limit(Resource.SPOTIFY):
+            stream_tracks(week_harvest, checkpoint)
+    except Exception:
+        for stage in STREAMED_STAGES:
+            save_stage_state(week_harvest, stage, StageStatus.FAILED)
+        raise
+    if not whole_week:
+        save_stage_state(week_harvest, "bp_tracks", StageStatus.DONE)
+        run_stage(week_harvest, "sp_tracks", force=True)
+        return
+    for stage in STREAMED_STAGES:
+        save_stage_state(week_harvest, stage, StageStatus.DONE)
+
+
+def refresh_clouder_week(week_harvest: WeekHarvest, watermark: dict):
+    """
+    Brings an already harvested week up to date and refills its playlists.
+    """
+    with limit(Resource.BEATPORT), limit(Resource.SPOTIFY):
+        refresh_tracks(week_harvest, watermark)
+    update_watermark(week_harvest)
+    run_stage(week_harvest, "sp_playlists")
+    run_stage(week_harvest, "sp_populate", force=True)
+
+
+def handle_clouder_week(
+    week_harvest: WeekHarvest,
+    force: Collection[str] = (),
+    streaming: bool = False,
+    releases: bool = False,
+    incremental: bool = False,
+):
+    """
+    Runs every stage of a week.
+
+    The release harvest only runs with `releases`. In streaming mode it runs
+    before the streamed stages, and as the stream does not page through the
+    tracks it adds, sp_tracks then makes a pass over the whole week.
+    With `incremental`, a week harvested before only collects the tracks
+    published since its watermark, see `refresh_tracks`.
+    """
+    logger.info("Processing week %s :: Starting", week_harvest)
+    unknown = set(force) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}")
     save_clouder_week(week_harvest)
-    collect_bp_tracks(week_harvest)
-    collect_sp_tracks(week_harvest)
-    create_sp_playlists(week_harvest)
-    populate_sp_playlists(week_harvest)
-    logger.info(f"Processing week {week_harvest} :: Done")
+    watermark = get_watermark(week_harvest) if incremental else None
+    if watermark is not None and not force:
+        refresh_clouder_week(week_harvest, watermark)
+        logger.info("Processing week %s :: Done", week_harvest)
+        return
+    stages = harvest_stages(releases)
+    if streaming:
+        if releases:
+            run_stage(week_harvest, "bp_releases", force="bp_releases" in force)
+            stages.remove("bp_releases")
+        run_streamed_stages(
+            week_harvest,
+            force=any(stage in force for stage in STREAMED_STAGES),
+            whole_week=not releases,
+        )
+        stages = [stage for stage in stages if stage not in STREAMED_STAGES]
+    for stage in stages:
+        run_stage(week_harvest, stage, force=stage in force)
+    update_watermark(week_harvest)
+    logger.info("Processing week %s :: Done", week_harvest)
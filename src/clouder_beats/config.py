@@ -1,37 +1,144 @@
 import os
+import sys
+import threading
+from collections.abc import Generator
+from typing import cast
 
-import typer
 from pydantic_settings import BaseSettings
 
 
-def get_bp_token(is_new: bool = False) -> str:
+class MissingTokenError(RuntimeError):
+    """No Beatport token is available and prompting is not possible."""
+
+
+def _read_token_file(path: str | None) -> str | None:
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().strip() or None
+
+
+def _stored_bp_tokens() -> Generator[str | None]:
+    yield settings.bp_api_token
+    yield _read_token_file(settings.bp_token_file)
+    yield _read_token_file(settings.bp_token_secret_file)
+
+
+def get_bp_token(stale_token: str | None = None) -> str:
     """
     Gets the Beatport API token.
+
+    Looks in the BP_API_TOKEN variable, the token cache file and the secret
+    store, in that order, skipping `stale_token` if the API rejected it.
+    Prompts only when running interactively in a terminal.
+
+    Raises:
+        MissingTokenError: If no usable token was found and prompting is
+            not possible
     """
-    if not is_new and os.path.exists(".bp_cache"):
-        with open(".bp_cache") as f:
-            return f.read()
-    else:
-        token = typer.prompt("Enter your Beatport API token", hide_input=True)
-        with open(".bp_cache", "w") as f:
-            f.write(token)
-        return token
+    for token in _stored_bp_tokens():
+        if token and token != stale_token:
+            return token
+
+    if not (settings.interactive and sys.stdin.isatty()):
+        raise MissingTokenError(
+            "No valid Beatport token, set BP_API_TOKEN or update "
+            f"{settings.bp_token_file}"
+        )
+    import typer
+
+    token = typer.prompt("Enter your Beatport API token", hide_input=True)
+    with open(settings.bp_token_file, "w") as f:
+        f.write(token)
+    return token
 
 
 class AppSettings(BaseSettings):
     env: str = "dev"
     log_level: str = "INFO"
+    log_format: str = "text"
+    log_debug_sample: int = 100
+    interactive: bool = True
     bp_api_url: str
-    bp_api_token: str = get_bp_token()
+    bp_api_token: str | None = None
+    bp_token_file: str = ".bp_cache"
+    bp_token_secret_file: str | None = "/run/secrets/bp_api_token"
     bp_chunk_size: int = 100
+    bp_timeout: float = 30.0
+    bp_concurrency: int = 4
+    bp_pool_connections: int = 4
+    bp_pool_maxsize: int = 8
+    bp_max_retries: int = 5
+    bp_backoff_base: float = 0.5
+    bp_backoff_max: float = 30.0
+    bp_rate_limit: float = 10.0
+    bp_max_in_flight: int = 8
+    bp_latency_target: float = 10.0
+    bp_archive_dir: str | None = None
+    bp_replay: bool = False
     mongo_url: str
     mongo_db: str
+    mongo_max_pool_size: int = 20
+    prometheus_textfile_dir: str | None = None
+    projection_enabled: bool = True
+    pipeline_queue_size: int = 4
+    job_lease_seconds: int = 300
+    job_heartbeat_seconds: int = 60
+    job_max_attempts: int = 3
+    job_retry_delay: float = 60.0
+    job_poll_seconds: float = 5.0
     spotipy_client_id: str
     spotipy_client_secret: str
     spotipy_redirect_uri: str
+    sp_api_url: str = "https://api.spotify.com/v1/"
+    sp_chunk_size: int = 500
+    sp_timeout: float = 10.0
+    sp_max_retries: int = 5
+    sp_backoff_factor: float = 0.5
+    sp_retry_after_max: float = 60.0
+    sp_token_refresh_margin: int = 300
+    sp_concurrency: int = 8
+    sp_rate_limit: float = 20.0
+    sp_max_in_flight: int = 16
+    sp_latency_target: float = 5.0
+    sp_playlist_sync: bool = True
+    isrc_cache_enabled: bool = True
+    isrc_cache_ttl_days: int = 30
+    isrc_cache_not_found_ttl_days: int = 3
 
     class Config:
         env_file = ".env"
 
 
-settings = AppSettings()
+class LazySettings:
+    """
+    Builds the settings on first use.
+
+    Importing a module therefore neither reads the environment nor fails on
+    missing variables, only code that needs a setting does.
+    """
+
+    def __init__(self):
+        object.__setattr__(self, "_settings", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _resolve(self) -> AppSettings:
+        if self._settings is None:
+            with self._lock:
+                if self._settings is None:
+                    object.__setattr__(self, "_settings", AppSettings())
+        return self._settings
+
+    def __getattr__(self, name: str):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._resolve(), name, value)
+
+    def reset(self):
+        """Drops the loaded settings, the next access reads them again."""
+        with self._lock:
+            object.__setattr__(self, "_settings", None)
+
+
+settings = cast(AppSettings, LazySettings())
@@ -0,0 +1,56 @@
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.clouder_beats.rate_limiter import AdaptiveLimiter
+
+
+def retry_after_seconds(response: requests.Response) -> float | None:
+    """
+    Returns the Retry-After of a response in seconds, if it sends one.
+
+    The header holds either a number of seconds or an HTTP date.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(float(retry_after), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at - time.time(), 0)
+
+
+class LimitedHTTPAdapter(HTTPAdapter):
+    """
+    Transport adapter that sends every request through an API limiter.
+
+    Mounted on a session, it limits all the calls made with that session,
+    whichever function or thread makes them.
+    """
+
+    def __init__(self, limiter: AdaptiveLimiter, *args, **kwargs):
+        self.limiter = limiter
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        self.limiter.acquire()
+        started = time.monotonic()
+        throttled = failed = False
+        try:
+            response = super().send(request, *args, **kwargs)
+            if response.status_code == 429:
+                throttled = True
+                self.limiter.throttle(retry_after_seconds(response))
+            return response
+        except requests.RequestException:
+            failed = True
+            raise
+        finally:
+            self.limiter.release(time.monotonic() - started, throttled, failed)
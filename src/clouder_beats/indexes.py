@@ -0,0 +1,177 @@
+import logging
+from datetime import UTC, datetime
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, errors
+
+from src.clouder_beats.collectors import (
+    _playlist_tracks_pipeline,
+    _stored_releases_pipeline,
+    _week_playlists_filter,
+    _week_tracks_filter,
+)
+from src.clouder_beats.isrc_cache import _fresh_entries_filter
+from src.clouder_beats.jobs import _claimable_filter
+from src.clouder_beats.mongo_adapter import get_mongo_conn, keys_filter
+from src.clouder_beats.watermarks import _newest_track_pipeline
+from src.clouder_beats.week_harvest import TRACK_WEEKS_FIELD, WeekHarvest
+
+logger = logging.getLogger("mongo")
+
+INDEXES = {
+    "bp_tracks": [
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+        IndexModel(
+            [(TRACK_WEEKS_FIELD, ASCENDING), ("id", ASCENDING)],
+            name="clouder_weeks_id",
+        ),
+        IndexModel([("release.id", ASCENDING)], name="release_id"),
+    ],
+    "sp_tracks": [
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+        IndexModel(
+            [(TRACK_WEEKS_FIELD, ASCENDING), ("popularity", DESCENDING)],
+            name="clouder_weeks_popularity",
+        ),
+        IndexModel([("bp_id", ASCENDING)], name="bp_id"),
+    ],
+    "sp_playlists": [
+        IndexModel([("playlist_id", ASCENDING)], name="playlist_id", unique=True),
+        IndexModel(
+            [("clouder_week", ASCENDING), ("clouder_pl_name", ASCENDING)],
+            name="clouder_week_pl_name",
+        ),
+    ],
+    "clouder_weeks": [
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+    ],
+    "statistics": [
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+    ],
+    "isrc_cache": [
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+    ],
+    "harvest_jobs": [
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+        IndexModel(
+            [("status", ASCENDING), ("available_at", ASCENDING)],
+            name="status_available_at",
+        ),
+        IndexModel(
+            [("status", ASCENDING), ("lease_expires_at", ASCENDING)],
+            name="status_lease_expires_at",
+        ),
+    ],
+    "harvest_watermarks": [
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+    ],
+    "harvest_stages": [
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+        IndexModel([("clouder_week", ASCENDING)], name="clouder_week"),
+    ],
+}
+
+
+def ensure_indexes() -> bool:
+    """
+    Creates the declared indexes, leaving existing ones untouched.
+
+    Returns False if any collection failed, for example because existing
+    documents violate a unique index.
+    """
+    db = get_mongo_conn()
+    ok = True
+    for collection, indexes in INDEXES.items():
+        try:
+            names = db[collection].create_indexes(indexes)
+            logger.info("Ensure indexes : %s : %s :: Done", collection, names)
+        except errors.PyMongoError as e:
+            logger.error("Failed to create indexes for %s :: %s", collection, e)
+            ok = False
+    return ok
+
+
+def pipeline_queries(
+    week_harvest: WeekHarvest,
+) -> list[tuple[str, dict | list, list | None]]:
+    """
+    Returns the hot queries of the pipeline as (collection, query, sort).
+
+    The query is a find filter, or a list for an aggregate pipeline, which
+    sorts in its own stages. Both are built by the helpers the pipeline
+    itself runs, with sample values.
+    """
+    week = week_harvest.clouder_week
+    stage_id = f"{week}:bp_tracks"
+    return [
+        ("bp_tracks", keys_filter(["id"], [{"id": 0}]), None),
+        ("bp_tracks", _week_tracks_filter(week_harvest, 0), [("id", ASCENDING)]),
+        ("bp_tracks", _stored_releases_pipeline([0]), None),
+        ("bp_tracks", _newest_track_pipeline(week_harvest), None),
+        ("sp_tracks", keys_filter(["id"], [{"id": ""}]), None),
+        ("sp_tracks", {"bp_id": {"$in": [0]}}, None),
+        ("sp_tracks", _playlist_tracks_pipeline(week_harvest), None),
+        ("sp_playlists", _week_playlists_filter(week_harvest), None),
+        ("sp_playlists", {"clouder_week": week}, None),
+        ("sp_playlists", keys_filter(["playlist_id"], [{"playlist_id": ""}]), None),
+        ("clouder_weeks", keys_filter(["id"], [{"id": week}]), None),
+        ("statistics", keys_filter(["id"], [{"id": week}]), None),
+        ("isrc_cache", _fresh_entries_filter([""]), None),
+        ("harvest_stages", {"id": stage_id}, None),
+        ("harvest_watermarks", {"id": week}, None),
+        ("harvest_jobs", {"id": stage_id}, None),
+        (
+            "harvest_jobs",
+            _claimable_filter(datetime.now(UTC)),
+            [("available_at", ASCENDING)],
+        ),
+    ]
+
+
+def _winning_plans(explain) -> list[dict]:
+    """
+    Returns the winning plans of an explain output, one per stage of an
+    aggregate pipeline that reads the collection.
+    """
+    if isinstance(explain, dict):
+        if "winningPlan" in explain:
+            return [explain["winningPlan"]]
+        return [plan for value in explain.values() for plan in _winning_plans(value)]
+    if isinstance(explain, list):
+        return [plan for value in explain for plan in _winning_plans(value)]
+    return []
+
+
+def _has_collscan(plan) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(value) for value in plan)
+    return False
+
+
+def check_indexes(week_harvest: WeekHarvest) -> list[tuple[str, dict | list]]:
+    """
+    Explains the pipeline queries and returns those planned as a collection scan.
+    """
+    db = get_mongo_conn()
+    collscans = []
+    for collection, query, sort in pipeline_queries(week_harvest):
+        if isinstance(query, list):
+            explain = db.command(
+                "explain",
+                {"aggregate": collection, "pipeline": query, "cursor": {}},
+                verbosity="queryPlanner",
+            )
+        else:
+            find = {"find": collection, "filter": query}
+            if sort:
+                find["sort"] = dict(sort)
+            explain = db.command("explain", find, verbosity="queryPlanner")
+        if any(_has_collscan(plan) for plan in _winning_plans(explain)):
+            logger.warning("Collection scan : %s : %s", collection, query)
+            collscans.append((collection, query))
+        else:
+            logger.info("Index scan : %s : %s", collection, query)
+    return collscans
@@ -0,0 +1,56 @@
+import logging
+from datetime import UTC, datetime, timedelta
+
+from src.clouder_beats.config import settings
+from src.clouder_beats.mongo_adapter import get_data, save_data_mongo_by_id
+
+logger = logging.getLogger("sp")
+
+ISRC_CACHE_COLLECTION = "isrc_cache"
+
+
+def _fresh_entries_filter(isrcs: list[str]) -> dict:
+    """Returns the filter of the cache entries of the ISRCs that did not expire."""
+    now = datetime.now(UTC)
+    found_since = now - timedelta(days=settings.isrc_cache_ttl_days)
+    not_found_since = now - timedelta(days=settings.isrc_cache_not_found_ttl_days)
+    return {
+        "id": {"$in": list(set(isrcs))},
+        "$or": [
+            {"found": True, "cached_at": {"$gte": found_since}},
+            {"found": False, "cached_at": {"$gte": not_found_since}},
+        ],
+    }
+
+
+def prefetch_isrc_cache(isrcs: list[str]) -> dict[str, dict | None]:
+    """
+    Returns the fresh cache entries for the given ISRCs in one query.
+
+    The value is the cached Spotify track, or None for a cached "not found".
+    ISRCs missing from the result are unknown or expired and must be searched.
+    """
+    if not settings.isrc_cache_enabled or not isrcs:
+        return {}
+    entries = get_data(
+        ISRC_CACHE_COLLECTION, _fresh_entries_filter(isrcs), ["id", "track"]
+    )
+    logger.info("ISRC cache : %s / %s hits", len(entries), len(isrcs))
+    return {entry["id"]: entry.get("track") for entry in entries}
+
+
+def store_isrc_cache(results: dict[str, dict | None]):
+    """Caches search results, including ISRCs that were not found."""
+    if not settings.isrc_cache_enabled or not results:
+        return
+    cached_at = datetime.now(UTC)
+    entries = [
+        {
+            "id": isrc,
+            "found": sp_track is not None,
+            "track": sp_track,
+            "cached_at": cached_at,
+        }
+        for isrc, sp_track in results.items()
+    ]
+    save_data_mongo_by_id(entries, ISRC_CACHE_COLLECTION)
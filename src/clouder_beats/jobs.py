@@ -0,0 +1,356 @@
+"""
+MongoDB-backed queue of harvest jobs.
+
+A job is one stage of one week, so several worker processes, on one node or
+many, can share a backfill. A worker claims a job by taking a lease on it,
+renews the lease while the stage runs and, once the stage is done, queues
+the next stage of the same week. A failed stage is retried after a delay
+until `job_max_attempts`. If a worker dies, its lease expires and another
+worker claims the job, which resumes from the stage checkpoint.
+"""
+
+import logging
+import os
+import socket
+import threading
+from collections.abc import Collection
+from datetime import UTC, datetime, timedelta
+from enum import Enum
+
+from pymongo import ReturnDocument, errors
+
+from src.clouder_beats.collectors import harvest_stages, run_stage, save_clouder_week
+from src.clouder_beats.config import settings
+from src.clouder_beats.limits import Resource, limit
+from src.clouder_beats.mongo_adapter import get_mongo_conn
+from src.clouder_beats.watermarks import update_watermark
+from src.clouder_beats.week_harvest import WeekHarvest
+
+logger = logging.getLogger("collectors")
+
+JOBS_COLLECTION = "harvest_jobs"
+
+
+class JobStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+def _jobs():
+    return get_mongo_conn()[JOBS_COLLECTION]
+
+
+def _job_id(week_harvest: WeekHarvest, stage: str) -> str:
+    return f"{week_harvest.clouder_week}:{stage}"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_stage(
+    week_harvest: WeekHarvest,
+    stages: list[str],
+    stage: str,
+    force: Collection[str] = (),
+) -> bool:
+    """
+    Queues one stage of a week, followed by the rest of `stages` in order.
+
+    Stages in `force` run again even if they are done. A stage that is
+    already pending or running is left alone.
+
+    Returns:
+        True if the stage was queued
+    """
+    now = datetime.now(UTC)
+    job = {
+        "clouder_week": week_harvest.clouder_week,
+        "week": week_harvest.week,
+        "year": week_harvest.year,
+        "style_id": week_harvest.style_id,
+        "stage": stage,
+        "stages": stages,
+        "force": sorted(force),
+        "status": JobStatus.PENDING.value,
+        "attempts": 0,
+        "available_at": now,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "error": None,
+        "updated_at": now,
+    }
+    active = [JobStatus.PENDING.value, JobStatus.RUNNING.value]
+    try:
+        with limit(Resource.MONGO):
+            _jobs().update_one(
+                {"id": _job_id(week_harvest, stage), "status": {"$nin": active}},
+                {"$set": job, "$setOnInsert": {"created_at": now}},
+                upsert=True,
+            )
+    except errors.DuplicateKeyError:
+        logger.info("%s Job %s already queued", week_harvest, stage)
+        return False
+    logger.info("%s Job %s queued", week_harvest, stage)
+    return True
+
+
+def enqueue_harvest(
+    week_harvest: WeekHarvest, force: Collection[str] = (), releases: bool = False
+) -> bool:
+    """Queues the first stage of a week, the others follow as it completes."""
+    stages = harvest_stages(releases)
+    return enqueue_stage(week_harvest, stages, stages[0], force)
+
+
+def _claimable_filter(now: datetime) -> dict:
+    """Returns the filter of the jobs a worker can claim at `now`."""
+    return {
+        "$or": [
+            {"status": JobStatus.PENDING.value, "available_at": {"$lte": now}},
+            {"status": JobStatus.RUNNING.value, "lease_expires_at": {"$lt": now}},
+        ],
+        "attempts": {"$lt": settings.job_max_attempts},
+    }
+
+
+def claim_job(worker_id: str) -> dict | None:
+    """
+    Leases the oldest available job to the worker.
+
+    Pending jobs whose retry delay has passed and running jobs whose lease
+    expired can be claimed.
+    """
+    now = datetime.now(UTC)
+    lease = {
+        "status": JobStatus.RUNNING.value,
+        "lease_owner": worker_id,
+        "lease_expires_at": now + timedelta(seconds=settings.job_lease_seconds),
+        "updated_at": now,
+    }
+    with limit(Resource.MONGO):
+        # The update is known in full, so the job is returned as it was and
+        # the lease is applied below. Returning the updated document does
+        # not work with mongomock, as the update changes filtered fields.
+        claimed = _jobs().find_one_and_update(
+            _claimable_filter(now),
+            {"$set": lease, "$inc": {"attempts": 1}},
+            projection={"_id": 0},
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.BEFORE,
+        )
+    if claimed is None:
+        return None
+    job = {**claimed, **lease, "attempts": claimed["attempts"] + 1}
+    logger.info(
+        "Job %s claimed by %s :: attempt %s", job["id"], worker_id, job["attempts"]
+    )
+    return job
+
+
+def renew_lease(job: dict, worker_id: str) -> bool:
+    """
+    Extends the lease of a running job.
+
+    Returns:
+        False if the worker no longer holds the lease
+    """
+    now = datetime.now(UTC)
+    with limit(Resource.MONGO):
+        result = _jobs().update_one(
+            {
+                "id": job["id"],
+                "status": JobStatus.RUNNING.value,
+                "lease_owner": worker_id,
+            },
+            {
+                "$set": {
+                    "lease_expires_at": now
+                    + timedelta(seconds=settings.job_lease_seconds),
+                    "updated_at": now,
+                }
+            },
+        )
+    return result.matched_count == 1
+
+
+def _finish_job(job: dict, worker_id: str, update: dict) -> bool:
+    with limit(Resource.MONGO):
+        result = _jobs().update_one(
+            {
+                "id": job["id"],
+                "status": JobStatus.RUNNING.value,
+                "lease_owner": worker_id,
+            },
+            {
+                "$set": {
+                    **update,
+                    "lease_owner": None,
+                    "lease_expires_at": None,
+                    "updated_at": datetime.now(UTC),
+                }
+            },
+        )
+    if result.matched_count != 1:
+        logger.warning("Job %s :: Lease lost by %s", job["id"], worker_id)
+        return False
+    return True
+
+
+def complete_job(job: dict, worker_id: str) -> bool:
+    """
+    Marks a job as done and queues the next stage of its week.
+
+    Returns:
+        False if the worker no longer held the lease
+    """
+    if not _finish_job(job, worker_id, {"status": JobStatus.DONE.value, "error": None}):
+        return False
+    week_harvest = WeekHarvest(job["week"], job["year"], job["style_id"])
+    stages = job["stages"]
+    index = stages.index(job["stage"])
+    if index + 1 < len(stages):
+        enqueue_stage(week_harvest, stages, stages[index + 1], job["force"])
+    else:
+        update_watermark(week_harvest)
+        logger.info("Processing week %s :: Done", week_harvest)
+    return True
+
+
+def fail_job(job: dict, worker_id: str, error: str):
+    """
+    Schedules a retry of a failed job, or marks it failed after its last
+    attempt.
+    """
+    if job["attempts"] >= settings.job_max_attempts:
+        logger.error("Job %s failed after %s attempts", job["id"], job["attempts"])
+        _finish_job(job, worker_id, {"status": JobStatus.FAILED.value, "error": error})
+        return
+    delay = settings.job_retry_delay * 2 ** (job["attempts"] - 1)
+    logger.warning(
+        "Job %s failed :: retry %s/%s in %.0fs",
+        job["id"],
+        job["attempts"],
+        settings.job_max_attempts - 1,
+        delay,
+    )
+    _finish_job(
+        job,
+        worker_id,
+        {
+            "status": JobStatus.PENDING.value,
+            "error": error,
+            "available_at": datetime.now(UTC) + timedelta(seconds=delay),
+        },
+    )
+
+
+def fail_expired_jobs() -> int:
+    """
+    Marks as failed the jobs whose lease expired on their last attempt.
+    """
+    now = datetime.now(UTC)
+    with limit(Resource.MONGO):
+        result = _jobs().update_many(
+            {
+                "status": JobStatus.RUNNING.value,
+                "lease_expires_at": {"$lt": now},
+                "attempts": {"$gte": settings.job_max_attempts},
+            },
+            {
+                "$set": {
+                    "status": JobStatus.FAILED.value,
+                    "error": "Lease expired",
+                    "lease_owner": None,
+                    "lease_expires_at": None,
+                    "updated_at": now,
+                }
+            },
+        )
+    if result.modified_count:
+        logger.error("Jobs failed on an expired lease :: %s", result.modified_count)
+    return result.modified_count
+
+
+def _keep_lease(
+    job: dict, worker_id: str, stop: threading.Event, lost: threading.Event
+):
+    while not stop.wait(settings.job_heartbeat_seconds):
+        if not renew_lease(job, worker_id):
+            logger.warning("Job %s :: Lease lost by %s", job["id"], worker_id)
+            lost.set()
+            return
+
+
+def run_job(job: dict, worker_id: str) -> bool:
+    """
+    Runs the stage of a claimed job while renewing its lease.
+
+    The lease is checked right before the stage starts, so a stage such as
+    sp_playlists, which is not safe to run twice at once, never starts once
+    another worker may have claimed the job. A job whose lease was lost
+    while its stage ran is left to the worker that holds it now.
+
+    Returns:
+        True if the stage succeeded and the job is done
+    """
+    week_harvest = WeekHarvest(job["week"], job["year"], job["style_id"])
+    stop, lost = threading.Event(), threading.Event()
+    heartbeat = threading.Thread(
+        target=_keep_lease,
+        args=(job, worker_id, stop, lost),
+        name=f"lease-{job['id']}",
+        daemon=True,
+    )
+    heartbeat.start()
+    try:
+        if job["stage"] == job["stages"][0]:
+            save_clouder_week(week_harvest)
+        if lost.is_set() or not renew_lease(job, worker_id):
+            logger.warning("Job %s :: Lease lost before the stage", job["id"])
+            return False
+        # Only the first attempt starts over, retries resume from the checkpoint
+        force = job["stage"] in job["force"] and job["attempts"] == 1
+        run_stage(week_harvest, job["stage"], force=force)
+    except Exception as e:
+        logger.exception("Job %s :: Failed", job["id"])
+        fail_job(job, worker_id, str(e))
+        return False
+    finally:
+        stop.set()
+        heartbeat.join()
+    if lost.is_set():
+        logger.warning("Job %s :: Lease lost while running :: Not completed", job["id"])
+        return False
+    return complete_job(job, worker_id)
+
+
+def run_worker(
+    worker_id: str,
+    stop: threading.Event | None = None,
+    drain: bool = False,
+) -> dict[str, int]:
+    """
+    Claims and runs jobs until `stop` is set.
+
+    With `drain` the worker also returns once no job is available.
+
+    Returns:
+        Count of succeeded and failed jobs
+    """
+    stop = stop or threading.Event()
+    counts = {"done": 0, "failed": 0}
+    logger.info("Worker %s :: Starting", worker_id)
+    while not stop.is_set():
+        fail_expired_jobs()
+        job = claim_job(worker_id)
+        if job is None:
+            if drain:
+                break
+            stop.wait(settings.job_poll_seconds)
+            continue
+        counts["done" if run_job(job, worker_id) else "failed"] += 1
+    logger.info("Worker %s :: Stopped :: %s", worker_id, counts)
+    return counts
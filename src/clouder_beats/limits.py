@@ -0,0 +1,36 @@
+import threading
+from contextlib import contextmanager
+from enum import Enum
+
+
+class Resource(Enum):
+    BEATPORT = "beatport"
+    SPOTIFY = "spotify"
+    MONGO = "mongo"
+
+
+_limits: dict[Resource, threading.BoundedSemaphore] = {}
+
+
+def configure_limits(limits: dict[Resource, int]):
+    """
+    Sets how many harvests may use each resource at the same time.
+
+    Resources without a limit are not restricted.
+    """
+    _limits.clear()
+    for resource, value in limits.items():
+        if value < 1:
+            raise ValueError(f"Limit for {resource.value} must be positive")
+        _limits[resource] = threading.BoundedSemaphore(value)
+
+
+@contextmanager
+def limit(resource: Resource):
+    """Holds one slot of the resource for the duration of the block."""
+    semaphore = _limits.get(resource)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
@@ -1,3 +1,7 @@
+import atexit
+import copy
+import itertools
+import json
 import logging
 import logging.config
 import logging.handlers
@@ -7,14 +11,86 @@ from datetime import datetime
 
 from src.clouder_beats.config import settings
 
+LOGGERS = ("main", "bp", "sp", "mongo", "collectors")
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one compact JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+
+_exception_formatter = logging.Formatter()
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that keeps the traceback apart from the message.
+
+    The message is still merged with its arguments before it is queued, as
+    they may change afterwards, but the traceback stays in `exc_text`, so
+    the JSON format can write it to its own field.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class SampledDebugFilter(logging.Filter):
+    """
+    Keeps one in `every` DEBUG records of each call site.
+
+    DEBUG is used for per-item events, such as a single ISRC search, which
+    would flood the logs at full rate. Other levels always pass.
+    """
+
+    def __init__(self, every: int = 1):
+        super().__init__()
+        self.every = max(every, 1)
+        self._counters = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.DEBUG or self.every == 1:
+            return True
+        key = (record.pathname, record.lineno)
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters.setdefault(key, itertools.count())
+        return next(counter) % self.every == 0
+
 
 def setup_logging():
-    """Sets up logging configuration."""
+    """
+    Sets up logging configuration.
+
+    Loggers only put records on a queue, and a background listener writes
+    them to stdout and the log file, so the harvest threads never wait on
+    I/O. With `log_format` "json" every line is a JSON object.
+    """
 
     os.makedirs("logs", exist_ok=True)
 
     log_filename = os.path.join("logs", f"{datetime.now().strftime('%Y-%m-%d')}.log")
     log_level = settings.log_level
+    formatter = "json" if settings.log_format == "json" else "standard"
 
     logging.config.dictConfig(
         {
@@ -24,49 +100,48 @@ def setup_logging():
                 "standard": {
                     "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
                 },
+                "json": {
+                    "()": JsonFormatter,
+                },
+            },
+            "filters": {
+                "sampled_debug": {
+                    "()": SampledDebugFilter,
+                    "every": settings.log_debug_sample,
+                },
             },
             "handlers": {
                 "default": {
                     "level": log_level,
-                    "formatter": "standard",
+                    "formatter": formatter,
                     "class": "logging.StreamHandler",
                     "stream": sys.stdout,
                 },
                 "logger_file": {
                     "level": log_level,
-                    "formatter": "standard",
+                    "formatter": formatter,
                     "class": "logging.handlers.RotatingFileHandler",
                     "filename": log_filename,
                     "maxBytes": 10_000_000,
                     "backupCount": 5,
                 },
-            },
-            "loggers": {
-                "main": {
-                    "handlers": ["default", "logger_file"],
-                    "level": log_level,
-                    "propagate": False,
-                },
-                "bp": {
-                    "handlers": ["default", "logger_file"],
-                    "level": log_level,
-                    "propagate": False,
-                },
-                "sp": {
+                "queue": {
+                    "class": f"{__name__}.StructuredQueueHandler",
                     "handlers": ["default", "logger_file"],
-                    "level": log_level,
-                    "propagate": False,
-                },
-                "mongo": {
-                    "handlers": ["default", "logger_file"],
-                    "level": log_level,
-                    "propagate": False,
+                    "filters": ["sampled_debug"],
+                    "respect_handler_level": True,
                 },
-                "collectors": {
-                    "handlers": ["default", "logger_file"],
+            },
+            "loggers": {
+                name: {
+                    "handlers": ["queue"],
                     "level": log_level,
                     "propagate": False,
-                },
+                }
+                for name in LOGGERS
             },
         }
     )
+    listener = logging.getHandlerByName("queue").listener
+    listener.start()
+    atexit.register(listener.stop)
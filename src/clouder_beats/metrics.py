@@ -0,0 +1,171 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections.abc import Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from src.clouder_beats.limits import Resource
+
+logger = logging.getLogger("main")
+
+PERCENTILES = (50, 95, 99)
+
+
+class StageMetrics:
+    """
+    API calls, retries and latencies recorded while one stage runs.
+
+    The instance is shared by every worker thread of the stage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._wall_time = None
+        self._latencies = {resource: [] for resource in Resource}
+        self._retries = dict.fromkeys(Resource, 0)
+
+    def record_call(self, resource: Resource, seconds: float):
+        with self._lock:
+            self._latencies[resource].append(seconds)
+
+    def record_retry(self, resource: Resource):
+        with self._lock:
+            self._retries[resource] += 1
+
+    def finish(self):
+        self._wall_time = time.monotonic() - self._started
+
+    @staticmethod
+    def _percentile(values: list[float], percentile: int) -> float:
+        """Nearest-rank percentile of sorted values."""
+        rank = math.ceil(percentile / 100 * len(values))
+        return values[max(rank, 1) - 1]
+
+    def summary(self) -> dict:
+        wall_time = self._wall_time
+        if wall_time is None:
+            wall_time = time.monotonic() - self._started
+        summary = {"wall_time": round(wall_time, 3)}
+        with self._lock:
+            for resource in Resource:
+                latencies = sorted(self._latencies[resource])
+                resource_summary = {
+                    "requests": len(latencies),
+                    "retries": self._retries[resource],
+                }
+                for percentile in PERCENTILES:
+                    resource_summary[f"p{percentile}"] = (
+                        round(self._percentile(latencies, percentile), 4)
+                        if latencies
+                        else None
+                    )
+                summary[resource.value] = resource_summary
+        return summary
+
+
+_current: ContextVar[StageMetrics | None] = ContextVar("stage_metrics", default=None)
+
+
+@contextmanager
+def collect_metrics() -> Generator[StageMetrics]:
+    """Records the calls made in this block, including in propagated workers."""
+    metrics = StageMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        metrics.finish()
+        _current.reset(token)
+
+
+def record_call(resource: Resource, seconds: float):
+    """Records one request to the resource, if a stage is being measured."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.record_call(resource, seconds)
+
+
+def record_retry(resource: Resource):
+    """Records one retried request to the resource."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.record_retry(resource)
+
+
+def propagate_metrics(func):
+    """
+    Binds the current stage metrics to a function run on a worker thread.
+
+    Thread pools do not inherit context variables, so without this the calls
+    made by workers would not be recorded.
+    """
+    metrics = _current.get()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current.set(metrics)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return wrapper
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def write_prometheus_textfile(
+    directory: str, stage: str, clouder_week: str, summary: dict
+):
+    """
+    Writes the stage metrics in the Prometheus textfile collector format.
+
+    Each week and stage has its own file holding its latest run, replaced
+    atomically.
+    """
+    stage_labels = _labels(stage=stage, clouder_week=clouder_week)
+    families = {
+        "clouder_beats_stage_wall_seconds": (
+            "Wall time of the stage.",
+            [(stage_labels, summary["wall_time"])],
+        ),
+        "clouder_beats_stage_requests": ("Requests made during the stage.", []),
+        "clouder_beats_stage_retries": ("Requests retried during the stage.", []),
+        "clouder_beats_stage_latency_seconds": ("Request latency percentiles.", []),
+    }
+    for resource in Resource:
+        resource_summary = summary[resource.value]
+        labels = f'{stage_labels},service="{resource.value}"'
+        families["clouder_beats_stage_requests"][1].append(
+            (labels, resource_summary["requests"])
+        )
+        families["clouder_beats_stage_retries"][1].append(
+            (labels, resource_summary["retries"])
+        )
+        for percentile in PERCENTILES:
+            value = resource_summary[f"p{percentile}"]
+            if value is not None:
+                families["clouder_beats_stage_latency_seconds"][1].append(
+                    (f'{labels},quantile="{percentile / 100}"', value)
+                )
+
+    lines = []
+    for name, (description, samples) in families.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{{{labels}}} {value}" for labels, value in samples)
+
+    os.makedirs(directory, exist_ok=True)
+    filename = f"clouder_beats_{clouder_week}_{stage}.prom".lower()
+    path = os.path.join(directory, filename)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
@@ -0,0 +1,120 @@
+import logging
+from itertools import batched
+
+from pymongo import DeleteMany, UpdateOne, errors
+
+from src.clouder_beats.indexes import ensure_indexes
+from src.clouder_beats.mongo_adapter import (
+    CONTENT_HASH_FIELD,
+    content_hash,
+    get_mongo_conn,
+)
+from src.clouder_beats.week_harvest import TRACK_WEEKS_FIELD
+
+logger = logging.getLogger("mongo")
+
+LEGACY_TRACK_INDEXES = {
+    "bp_tracks": ["clouder_week_id"],
+    "sp_tracks": ["clouder_week_id", "clouder_week_popularity"],
+}
+
+
+def _migrated_track(group: dict) -> tuple[str, list[str]]:
+    """Returns the payload hash of a grouped track and every week it is in."""
+    document = dict(group["doc"])
+    for field in ("_id", "clouder_week", TRACK_WEEKS_FIELD, CONTENT_HASH_FIELD):
+        document.pop(field, None)
+    weeks = set(group["weeks"])
+    for known_weeks in group["known_weeks"]:
+        weeks.update(known_weeks)
+    return content_hash(document), sorted(weeks)
+
+
+def _migration_operations(collection, batch: tuple[dict, ...]) -> list:
+    """
+    Returns the writes that migrate a batch of grouped tracks in place.
+
+    The most recent legacy document of a track becomes its document, unless
+    the new code already stored one, which then only gets the weeks. Either
+    way a track never has two documents without a `clouder_week`, so the
+    unique `id` index holds. The other legacy copies are deleted last, so an
+    interrupted run still finds them.
+    """
+    ids = [group["_id"] for group in batch]
+    current = {"clouder_week": {"$exists": False}}
+    stored = set(collection.distinct("id", {"id": {"$in": ids}, **current}))
+    operations = []
+    for group in batch:
+        document_hash, weeks = _migrated_track(group)
+        add_weeks = {TRACK_WEEKS_FIELD: {"$each": weeks}}
+        if group["_id"] in stored:
+            operations.append(
+                UpdateOne({"id": group["_id"], **current}, {"$addToSet": add_weeks})
+            )
+            continue
+        operations.append(
+            UpdateOne(
+                {"_id": group["doc"]["_id"]},
+                {
+                    "$set": {CONTENT_HASH_FIELD: document_hash},
+                    "$unset": {"clouder_week": ""},
+                    "$addToSet": add_weeks,
+                },
+            )
+        )
+    operations.append(
+        DeleteMany({"id": {"$in": ids}, "clouder_week": {"$exists": True}})
+    )
+    return operations
+
+
+def migrate_track_store(batch_size: int = 1000) -> dict[str, int]:
+    """
+    Folds the per-week track documents into one document per track.
+
+    Documents of the same track in several weeks are merged in place: the
+    most recent one is kept, unless the track was already stored by the new
+    code, and every week goes into its `clouder_weeks` array. Running it
+    again only migrates documents that still have a `clouder_week`.
+
+    Returns:
+        Count of migrated tracks per collection
+    """
+    db = get_mongo_conn()
+    migrated = {}
+    for collection_name, legacy_indexes in LEGACY_TRACK_INDEXES.items():
+        collection = db[collection_name]
+        for index_name in legacy_indexes:
+            try:
+                collection.drop_index(index_name)
+                logger.info("Drop index : %s : %s", collection_name, index_name)
+            except errors.OperationFailure:
+                pass
+
+        legacy = {"clouder_week": {"$exists": True}}
+        groups = collection.aggregate(
+            [
+                {"$match": legacy},
+                {"$sort": {"_id": 1}},
+                {
+                    "$group": {
+                        "_id": "$id",
+                        "doc": {"$last": "$$ROOT"},
+                        "weeks": {"$addToSet": "$clouder_week"},
+                        "known_weeks": {
+                            "$push": {"$ifNull": [f"${TRACK_WEEKS_FIELD}", []]}
+                        },
+                    }
+                },
+            ],
+            allowDiskUse=True,
+        )
+        count = 0
+        for batch in batched(groups, batch_size):
+            collection.bulk_write(_migration_operations(collection, batch))
+            count += len(batch)
+            logger.info("Migrate tracks : %s : %s :: Progress", collection_name, count)
+        migrated[collection_name] = count
+        logger.info("Migrate tracks : %s : %s :: Done", collection_name, count)
+    ensure_indexes()
+    return migrated
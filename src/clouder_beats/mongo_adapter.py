@@ -1,88 +1,299 @@
+import hashlib
+import json
 import logging
+import os
+import threading
+from collections.abc import Generator
 
-from pymongo import MongoClient, UpdateOne, errors
+from pymongo import MongoClient, UpdateOne, errors, monitoring
 from pymongo.synchronous.database import Database
 
 from src.clouder_beats.config import settings
+from src.clouder_beats.limits import Resource, limit
+from src.clouder_beats.metrics import record_call
 
 logger = logging.getLogger("mongo")
 
+CONTENT_HASH_FIELD = "_content_hash"
+
+_client: MongoClient | None = None
+_client_lock = threading.Lock()
+
+
+class MetricsCommandListener(monitoring.CommandListener):
+    """Records every MongoDB command in the metrics of the running stage."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record_call(Resource.MONGO, event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        record_call(Resource.MONGO, event.duration_micros / 1_000_000)
+
+
+def get_mongo_client() -> MongoClient:
+    """
+    Returns the process-wide MongoDB client, creating it on first use.
+
+    The client keeps a connection pool that every adapter function reuses,
+    so the connection is checked with a ping only once per process.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                client = MongoClient(
+                    settings.mongo_url,
+                    serverSelectionTimeoutMS=5000,
+                    maxPoolSize=settings.mongo_max_pool_size,
+                    event_listeners=[MetricsCommandListener()],
+                )
+            except Exception as e:
+                logger.error("Failed to connect to MongoDB :: %s", e)
+                raise
+
+            try:
+                client.admin.command("ping")
+            except Exception as e:
+                logger.error("Failed to check the MongoDB database. :: %s", e)
+                client.close()
+                raise
+            _client = client
+        return _client
+
+
+def close_mongo_client():
+    """Closes the process-wide MongoDB client, if it was created."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def _reset_mongo_client_after_fork():
+    """
+    Drops the parent's client in a forked child.
+
+    A MongoClient is not fork-safe, so the child lazily creates its own one
+    instead of closing or reusing the parent's sockets.
+    """
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_mongo_client_after_fork)
+
 
 def get_mongo_conn() -> Database:
-    """Connects to MongoDB and returns the database object."""
-    mongo_url = settings.mongo_url
-    mongo_db = settings.mongo_db
-    try:
-        client = MongoClient(mongo_url, serverSelectionTimeoutMS=5000)
-    except Exception as e:
-        logger.error(f"Failed to connect to MongoDB :: {e}")
-        raise
+    """Returns the database object of the process-wide MongoDB client."""
+    return get_mongo_client()[settings.mongo_db]
 
-    try:
-        client.admin.command("ping")
-        return client[mongo_db]
-    except Exception as e:
-        logger.error(f"Failed to check the MongoDB database. :: {e}")
-        raise
+
+def content_hash(item: dict) -> str:
+    """Returns a stable hash of the document payload, ignoring the hash itself"""
+    payload = {key: value for key, value in item.items() if key != CONTENT_HASH_FIELD}
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def keys_filter(key_fields: list, keys: list[dict]) -> dict:
+    """
+    Returns the filter matching the documents with the given keys.
+
+    Single-field keys, such as `id`, are matched with one `$in`, which the
+    planner serves from a single index scan. Only composite keys need one
+    `$or` clause per key.
+    """
+    if len(key_fields) == 1:
+        field = key_fields[0]
+        return {field: {"$in": [key[field] for key in keys]}}
+    return {"$or": keys}
+
+
+def _get_stored_hashes(
+    collection, key_fields: list, keys: list[dict]
+) -> dict[tuple, str]:
+    """Returns the stored content hash of each existing document by its key"""
+    fields = {"_id": 0, CONTENT_HASH_FIELD: 1}
+    fields.update({field: 1 for field in key_fields})
+    return {
+        tuple(doc.get(field) for field in key_fields): doc.get(CONTENT_HASH_FIELD)
+        for doc in collection.find(keys_filter(key_fields, keys), fields)
+    }
+
+
+def _build_operations(
+    data: list[dict],
+    keys: list[dict],
+    stored_hashes: dict[tuple, str],
+    add_to_set: dict | None,
+) -> tuple[list[UpdateOne], list[UpdateOne]]:
+    """
+    Returns the upserts of changed items and the membership-only updates of
+    unchanged ones.
+    """
+    operations = []
+    membership_operations = []
+    for item, item_keys in zip(data, keys, strict=True):
+        item_hash = content_hash(item)
+        if stored_hashes.get(tuple(item_keys.values())) == item_hash:
+            if add_to_set:
+                membership_operations.append(
+                    UpdateOne(item_keys, {"$addToSet": add_to_set})
+                )
+            continue
+        update = {"$set": {**item, CONTENT_HASH_FIELD: item_hash}}
+        if add_to_set:
+            update["$addToSet"] = add_to_set
+        operations.append(UpdateOne(item_keys, update, upsert=True))
+    return operations, membership_operations
 
 
 def save_data_mongo_by_id(
-    data, collection_name: str, key_fields: list = None, db: MongoClient = None
-) -> tuple[int, int]:
-    """Save data to MongoDB by id in collection"""
-    logger.info(f"Save data : {collection_name} : count = {len(data)} :: Start")
-    close_connection = False
+    data,
+    collection_name: str,
+    key_fields: list = None,
+    db: MongoClient = None,
+    detect_changes: bool = True,
+    add_to_set: dict | None = None,
+    raise_errors: bool = False,
+) -> tuple[int, int, int]:
+    """
+    Save data to MongoDB by id in collection
+
+    Every document stores a hash of its payload. With `detect_changes`,
+    items whose hash matches the stored one are not written at all.
+    `add_to_set` values, such as the week a track belongs to, are added to
+    array fields of every item, whether its payload changed or not.
+
+    A MongoDB error is logged and nothing is reported saved, unless
+    `raise_errors` is set, for callers that must not go on past a failed
+    write, such as a stage that checkpoints after it.
+
+    Returns:
+        Counts of inserted, updated and unchanged documents
+    """
+    logger.debug("Save data : %s : count = %s :: Start", collection_name, len(data))
     if db is None:
         db = get_mongo_conn()
-        close_connection = True
     if not key_fields:
         key_fields = [
             "id",
         ]
+    if not data:
+        logger.info("Save data : %s : count = 0 :: Done", collection_name)
+        return 0, 0, 0
 
-    operations = []
-    for item in data:
-        item_keys = {field: item[field] for field in key_fields}
-        operations.append(UpdateOne(item_keys, {"$set": item}, upsert=True))
-
-    if not operations:
-        logger.info(f"Save data : {collection_name} : count = 0 :: Done")
-        return 0, 0
+    collection = db[collection_name]
     try:
-        result = db[collection_name].bulk_write(operations)
+        keys = [{field: item[field] for field in key_fields} for item in data]
+        with limit(Resource.MONGO):
+            stored_hashes = (
+                _get_stored_hashes(collection, key_fields, keys)
+                if detect_changes
+                else {}
+            )
+        operations, membership_operations = _build_operations(
+            data, keys, stored_hashes, add_to_set
+        )
+        skipped = len(data) - len(operations)
+        if membership_operations:
+            with limit(Resource.MONGO):
+                collection.bulk_write(membership_operations, ordered=False)
+        if not operations:
+            logger.info(
+                "Save data : %s : unchanged=%s :: Done", collection_name, skipped
+            )
+            return 0, 0, skipped
+        with limit(Resource.MONGO):
+            result = collection.bulk_write(operations)
         inserted = result.upserted_count
-        updated = result.matched_count
-        logger.info(f"Save data : {collection_name} : {inserted=} : {updated=} :: Done")
-        return inserted, updated
+        updated = result.modified_count
+        unchanged = skipped + result.matched_count - result.modified_count
+        logger.info(
+            "Save data : %s : inserted=%s : updated=%s : unchanged=%s :: Done",
+            collection_name,
+            inserted,
+            updated,
+            unchanged,
+        )
+        return inserted, updated, unchanged
     except errors.PyMongoError as e:
-        logger.error(f"MongoDB error while saving to {collection_name}: {e}")
-        return 0, 0
-    finally:
-        if close_connection:
-            db.client.close()
+        logger.error("MongoDB error while saving to %s: %s", collection_name, e)
+        if raise_errors:
+            raise
+        return 0, 0, 0
 
 
-def get_data(
+def add_to_set_many(
+    collection_name: str, query_filters: dict, values: dict, db: MongoClient = None
+) -> int:
+    """
+    Adds the values to array fields of every matching document.
+
+    Returns:
+        Count of documents that did not hold the values yet
+    """
+    if db is None:
+        db = get_mongo_conn()
+    with limit(Resource.MONGO):
+        result = db[collection_name].update_many(query_filters, {"$addToSet": values})
+    logger.info(
+        "Add to set : %s : %s : modified=%s :: Done",
+        collection_name,
+        values,
+        result.modified_count,
+    )
+    return result.modified_count
+
+
+def iter_data(
     collection: str,
     query_filters: dict = None,
     query_fields: list = None,
     query_sort: list = None,
+    batch_size: int = None,
     db: MongoClient = None,
-) -> list:
-    """Get data from MongoDB"""
-    logger.info(f"Get data : {collection} with filters : {query_filters} :: Start")
-    close_connection = False
+) -> Generator[dict]:
+    """Stream data from MongoDB, fetching `batch_size` documents per round trip"""
+    logger.debug("Get data : %s with filters : %s :: Start", collection, query_filters)
     if db is None:
         db = get_mongo_conn()
-        close_connection = True
     filters = {}
     filters.update(query_filters) if query_filters else filters
     fields = {"_id": 0}
     fields.update({field: 1 for field in query_fields}) if query_fields else fields
-    try:
-        cursor = db[collection].find(filters, fields)
-        result = list(cursor.sort(query_sort) if query_sort else cursor)
-        return result
-    finally:
-        if close_connection:
-            db.client.close()
+    cursor = db[collection].find(filters, fields)
+    if query_sort:
+        cursor = cursor.sort(query_sort)
+    if batch_size:
+        cursor = cursor.batch_size(batch_size)
+    with cursor:
+        yield from cursor
+
+
+def get_data(
+    collection: str,
+    query_filters: dict = None,
+    query_fields: list = None,
+    query_sort: list = None,
+    db: MongoClient = None,
+) -> list:
+    """Get data from MongoDB"""
+    with limit(Resource.MONGO):
+        return list(
+            iter_data(collection, query_filters, query_fields, query_sort, db=db)
+        )
+
+
+def aggregate_data(collection: str, pipeline: list, db: MongoClient = None) -> list:
+    """Run an aggregation pipeline in MongoDB"""
+    logger.debug("Aggregate data : %s : %s stages :: Start", collection, len(pipeline))
+    if db is None:
+        db = get_mongo_conn()
+    with limit(Resource.MONGO):
+        return list(db[collection].aggregate(pipeline))
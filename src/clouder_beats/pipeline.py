@@ -0,0 +1,126 @@
+"""
+Overlapped execution of the stages of a harvest.
+
+`run_pipeline` consumes a source on the calling thread and runs every stage
+on its own thread, connected by bounded queues. A stage starts on the first
+item while the source is still producing later ones, so the run takes about
+as long as its slowest stage rather than the sum of all of them, and the
+queues keep at most a few items in memory.
+"""
+
+import logging
+import queue
+import threading
+from collections.abc import Callable, Iterable
+
+from src.clouder_beats.metrics import propagate_metrics
+
+logger = logging.getLogger("collectors")
+
+_DONE = object()
+_POLL_SECONDS = 0.5
+
+
+class PipelineAbortedError(Exception):
+    """Another part of the pipeline failed, so this one stopped."""
+
+
+class _Pipeline:
+    def __init__(self, stages: tuple[Callable, ...], queue_size: int):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.aborted = threading.Event()
+        self.errors = []
+
+    def fail(self, error: BaseException):
+        if not self.errors:
+            self.errors.append(error)
+        self.aborted.set()
+
+    def put(self, index: int, item):
+        while True:
+            if self.aborted.is_set():
+                raise PipelineAbortedError
+            try:
+                self.queues[index].put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def get(self, index: int):
+        while True:
+            if self.aborted.is_set():
+                raise PipelineAbortedError
+            try:
+                return self.queues[index].get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+
+    def run_stage(self, index: int):
+        func = self.stages[index]
+        is_last = index + 1 == len(self.stages)
+        try:
+            while (item := self.get(index)) is not _DONE:
+                result = func(item)
+                if not is_last:
+                    self.put(index + 1, result)
+            if not is_last:
+                self.put(index + 1, _DONE)
+        except PipelineAbortedError:
+            pass
+        except BaseException as e:
+            logger.error("Pipeline stage %s failed :: %s", func.__name__, e)
+            self.fail(e)
+
+    def feed(self, source: Iterable):
+        items = iter(source)
+        try:
+            for item in items:
+                self.put(0, item)
+        except PipelineAbortedError:
+            return
+        except Exception as e:
+            # The items already produced still go through the stages
+            self.errors.append(e)
+        except BaseException as e:
+            self.fail(e)
+            return
+        finally:
+            if hasattr(items, "close"):
+                # Stops a generator source, e.g. its pending page requests
+                items.close()
+        try:
+            self.put(0, _DONE)
+        except PipelineAbortedError:
+            pass
+
+
+def run_pipeline(source: Iterable, *stages: Callable, queue_size: int = 4):
+    """
+    Feeds the source items through the stages.
+
+    Each stage is called with the item returned by the previous one, in
+    source order, and the value of the last stage is dropped. An exception
+    in a stage stops the whole pipeline, while one in the source lets the
+    items it already produced finish first. The first exception is raised
+    again here.
+    """
+    pipeline = _Pipeline(stages, queue_size)
+    threads = [
+        threading.Thread(
+            target=propagate_metrics(pipeline.run_stage),
+            args=(index,),
+            name=f"pipeline-{func.__name__}",
+            daemon=True,
+        )
+        for index, func in enumerate(stages)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        pipeline.feed(source)
+    finally:
+        for thread in threads:
+            thread.join()
+    if pipeline.errors:
+        raise pipeline.errors[0]
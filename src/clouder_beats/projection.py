@@ -0,0 +1,100 @@
+"""
+Field projection applied to documents before they are stored.
+
+Each collection listed in SCHEMAS keeps only its whitelisted fields. Fields
+are dotted paths, and a path through a list applies to every element, so
+"artists.name" keeps the name of each artist. Collections without a schema
+are stored as they are. The full Beatport payload can still be kept in the
+raw page archive (see bp_archive).
+"""
+
+from collections.abc import Iterable
+
+from src.clouder_beats.config import settings
+
+SCHEMAS = {
+    "bp_tracks": (
+        "id",
+        "isrc",
+        "name",
+        "mix_name",
+        "bpm",
+        "length_ms",
+        "publish_date",
+        "new_release_date",
+        "genre.id",
+        "genre.name",
+        "sub_genre.id",
+        "sub_genre.name",
+        "key.name",
+        "artists.id",
+        "artists.name",
+        "remixers.id",
+        "remixers.name",
+        "release.id",
+        "release.name",
+        "label.id",
+        "label.name",
+    ),
+    "sp_tracks": (
+        "id",
+        "uri",
+        "name",
+        "popularity",
+        "duration_ms",
+        "explicit",
+        "external_ids.isrc",
+        "artists.id",
+        "artists.name",
+        "album.id",
+        "album.name",
+        "album.album_type",
+        "album.release_date",
+        "bp_id",
+        "bp_genre_id",
+    ),
+}
+
+
+def _compile(fields: Iterable[str]) -> dict:
+    """Turns dotted paths into a tree, where True keeps the whole value."""
+    tree = {}
+    for field in fields:
+        node = tree
+        *parents, leaf = field.split(".")
+        for part in parents:
+            child = node.setdefault(part, {})
+            if child is True:
+                break
+            node = child
+        else:
+            node[leaf] = True
+    return tree
+
+
+_TREES = {collection: _compile(fields) for collection, fields in SCHEMAS.items()}
+
+
+def _apply(value, tree: dict):
+    if isinstance(value, list):
+        return [_apply(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {
+        key: value[key] if subtree is True else _apply(value[key], subtree)
+        for key, subtree in tree.items()
+        if key in value
+    }
+
+
+def project(collection: str, document: dict | None) -> dict | None:
+    """Returns the document with only the fields kept for the collection."""
+    tree = _TREES.get(collection)
+    if document is None or tree is None or not settings.projection_enabled:
+        return document
+    return _apply(document, tree)
+
+
+def project_documents(collection: str, documents: Iterable[dict]) -> list[dict]:
+    """Projects every document for the collection."""
+    return [project(collection, document) for document in documents]
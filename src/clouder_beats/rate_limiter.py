@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+
+from src.clouder_beats.config import settings
+from src.clouder_beats.limits import Resource
+
+logger = logging.getLogger("main")
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket.
+
+    Allows `rate` calls per second on average with bursts of up to `burst`
+    calls. A single instance is meant to be shared by every worker calling
+    the same API.
+    """
+
+    def __init__(self, rate: float, burst: int | None = None):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self._rate = rate
+        self._capacity = float(burst or max(1, round(rate)))
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+        self._updated_at = now
+
+    def acquire(self):
+        """Blocks until a call is allowed."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    Rate and concurrency limit of one API, shared by every caller.
+
+    A token bucket caps the request rate. On top of it, the number of
+    requests in flight adapts AIMD-style: each successful request widens the
+    window by 1 / window (so +1 per round of requests), while a throttled
+    response, a failed request, such as a timeout, or a latency above
+    `latency_target` halves it, at most once per `cooldown` seconds. A
+    Retry-After pauses every caller, not only the one that got it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        max_concurrency: int,
+        latency_target: float | None = None,
+        cooldown: float = 1.0,
+    ):
+        if max_concurrency < 1:
+            raise ValueError(f"Concurrency must be positive, got {max_concurrency}")
+        self.name = name
+        self._bucket = RateLimiter(rate)
+        self._max_concurrency = max_concurrency
+        self._window = float(max(1, max_concurrency // 2))
+        self._latency_target = latency_target
+        self._cooldown = cooldown
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def concurrency(self) -> int:
+        """Current number of requests allowed in flight."""
+        return int(self._window)
+
+    def acquire(self):
+        """Blocks until a request may start, then takes a slot for it."""
+        with self._condition:
+            while self._in_flight >= int(self._window):
+                self._condition.wait()
+            self._in_flight += 1
+            pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        self._bucket.acquire()
+
+    def release(self, latency: float, throttled: bool = False, failed: bool = False):
+        """
+        Frees the slot of a finished request and adapts the window.
+
+        `failed` tells that the request got no response, such as on a
+        connection error or a timeout.
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self._decrease("429")
+            elif failed:
+                self._decrease("error")
+            elif self._latency_target is not None and latency > self._latency_target:
+                self._decrease(f"latency {latency:.2f}s")
+            else:
+                self._window = min(
+                    self._max_concurrency, self._window + 1 / self._window
+                )
+            self._condition.notify_all()
+
+    def throttle(self, retry_after: float | None = None):
+        """Reports a throttled response, pausing all callers for `retry_after`."""
+        with self._condition:
+            self._decrease("429")
+            if retry_after:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        if now - self._decreased_at < self._cooldown:
+            return
+        self._decreased_at = now
+        self._window = max(1.0, self._window / 2)
+        logger.info(
+            "Rate limiter %s : %s :: concurrency down to %s",
+            self.name,
+            reason,
+            self.concurrency,
+        )
+
+
+_api_limiters: dict[Resource, AdaptiveLimiter] = {}
+_api_limiters_lock = threading.Lock()
+
+
+def get_api_limiter(resource: Resource) -> AdaptiveLimiter:
+    """
+    Returns the process-wide limiter of an API, creating it on first use.
+
+    Every harvest running in the process shares it.
+    """
+    with _api_limiters_lock:
+        if resource not in _api_limiters:
+            if resource == Resource.BEATPORT:
+                limiter = AdaptiveLimiter(
+                    resource.value,
+                    settings.bp_rate_limit,
+                    settings.bp_max_in_flight,
+                    settings.bp_latency_target,
+                )
+            elif resource == Resource.SPOTIFY:
+                limiter = AdaptiveLimiter(
+                    resource.value,
+                    settings.sp_rate_limit,
+                    settings.sp_max_in_flight,
+                    settings.sp_latency_target,
+                )
+            else:
+                raise ValueError(f"No API limiter for {resource.value}")
+            _api_limiters[resource] = limiter
+        return _api_limiters[resource]
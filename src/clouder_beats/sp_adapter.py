@@ -1,44 +1,287 @@
 import logging
+import sys
+import threading
+import time
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
 from itertools import batched
 
+import requests
 from spotipy import Spotify
+from spotipy.cache_handler import CacheFileHandler
 from spotipy.oauth2 import SpotifyOAuth
+from urllib3.util.retry import Retry
+
+from src.clouder_beats.config import settings
+from src.clouder_beats.http_adapter import LimitedHTTPAdapter
+from src.clouder_beats.limits import Resource
+from src.clouder_beats.metrics import propagate_metrics, record_call, record_retry
+from src.clouder_beats.rate_limiter import get_api_limiter
 
 logger = logging.getLogger("sp")
 
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_sp: Spotify | None = None
+_sp_lock = threading.Lock()
+
+
+class MissingSpotifyTokenError(RuntimeError):
+    """
+    No cached Spotify token covers the requested scopes and authorizing
+    again is not possible.
+    """
+
+
+class MemoryTokenCacheHandler(CacheFileHandler):
+    """
+    Keeps the token in memory, so the cache file is read only once per process.
+
+    Refreshed tokens are still written to the file for the next run.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._token_info = None
+        self._loaded = False
+
+    def get_cached_token(self):
+        if not self._loaded:
+            self._token_info = super().get_cached_token()
+            self._loaded = True
+        return self._token_info
+
+    def save_token_to_cache(self, token_info):
+        self._token_info = token_info
+        self._loaded = True
+        super().save_token_to_cache(token_info)
+
+
+class SharedSpotifyOAuth(SpotifyOAuth):
+    """
+    OAuth manager that can be shared between threads.
+
+    Only one thread refreshes the token at a time, and the token is refreshed
+    `sp_token_refresh_margin` seconds before it expires.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._token_lock = threading.Lock()
 
-def create_sp():
-    scope = "playlist-modify-public playlist-modify-private"
-    return Spotify(
-        auth_manager=SpotifyOAuth(scope=scope, open_browser=False, show_dialog=True)
+    @staticmethod
+    def is_token_expired(token_info):
+        margin = settings.sp_token_refresh_margin
+        return token_info["expires_at"] - int(time.time()) < margin
+
+    def get_access_token(self, *args, **kwargs):
+        with self._token_lock:
+            return super().get_access_token(*args, **kwargs)
+
+    def get_auth_response(self, *args, **kwargs):
+        """
+        Asks for the authorization code, which only works interactively in a
+        terminal. Elsewhere, such as under cron or the worker, it fails
+        instead of waiting on a prompt nobody answers.
+        """
+        if not (settings.interactive and sys.stdin.isatty()):
+            raise MissingSpotifyTokenError(
+                f"No valid Spotify token for scopes '{self.scope}', authorize "
+                f"once interactively to update {self.cache_handler.cache_path}"
+            )
+        return super().get_auth_response(*args, **kwargs)
+
+
+class SpotifyRetry(Retry):
+    """
+    Retry policy that caps how long a Retry-After header can make us wait.
+
+    Throttled responses retried here are reported to the Spotify limiter too,
+    so the other workers back off as well.
+    """
+
+    def parse_retry_after(self, retry_after: str) -> float:
+        return min(super().parse_retry_after(retry_after), settings.sp_retry_after_max)
+
+    def increment(self, *args, **kwargs):
+        record_retry(Resource.SPOTIFY)
+        response = kwargs.get("response")
+        if response is not None and response.status == 429:
+            get_api_limiter(Resource.SPOTIFY).throttle(self.get_retry_after(response))
+        return super().increment(*args, **kwargs)
+
+
+def _record_sp_response(response: requests.Response, *args, **kwargs):
+    record_call(Resource.SPOTIFY, response.elapsed.total_seconds())
+
+
+def _build_sp_session() -> requests.Session:
+    retry = SpotifyRetry(
+        total=settings.sp_max_retries,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+        status=settings.sp_max_retries,
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=settings.sp_backoff_factor,
+        respect_retry_after_header=True,
+    )
+    adapter = LimitedHTTPAdapter(
+        get_api_limiter(Resource.SPOTIFY),
+        pool_connections=1,
+        pool_maxsize=settings.sp_concurrency,
+        max_retries=retry,
     )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(_record_sp_response)
+    return session
+
+
+def create_sp() -> Spotify:
+    scope = "playlist-read-private playlist-modify-public playlist-modify-private"
+    auth_manager = SharedSpotifyOAuth(
+        scope=scope,
+        open_browser=False,
+        show_dialog=True,
+        cache_handler=MemoryTokenCacheHandler(),
+    )
+    sp = Spotify(
+        auth_manager=auth_manager,
+        requests_session=_build_sp_session(),
+        requests_timeout=settings.sp_timeout,
+    )
+    sp.prefix = settings.sp_api_url
+    return sp
+
+
+def get_sp() -> Spotify:
+    """
+    Returns the process-wide Spotify client, creating it on first use.
+
+    The client is thread-safe and reuses its pooled HTTP connections and the
+    in-memory token for every call.
+    """
+    global _sp
+    with _sp_lock:
+        if _sp is None:
+            _sp = create_sp()
+        return _sp
+
+
+def close_sp():
+    """Closes the process-wide Spotify client and its pooled connections."""
+    global _sp
+    with _sp_lock:
+        if _sp is not None:
+            _sp._session.close()
+            _sp = None
 
 
 def get_track_by_isrc(isrc: str) -> dict | None:
-    sp = create_sp()
+    sp = get_sp()
     track_result = sp.search(q=f"isrc:{isrc}", type="track", limit=1)
     tracks = track_result["tracks"]["items"]
     if tracks:
         sp_track = tracks[0]
+        logger.debug("Search ISRC : %s : %s :: Found", isrc, sp_track["id"])
         return sp_track
+    logger.debug("Search ISRC : %s :: Not found", isrc)
     return None
 
 
+def get_tracks_by_isrc(isrcs: list[str]) -> Generator[tuple[str, dict | None]]:
+    """
+    Resolves ISRCs on a pool of `sp_concurrency` workers.
+
+    All workers share the Spotify limiter, so throughput is capped by the API
+    budget rather than by the latency of a single search.
+
+    Yields:
+        ISRC and the found Spotify track (or None), in input order
+    """
+    with ThreadPoolExecutor(
+        max_workers=settings.sp_concurrency, thread_name_prefix="sp"
+    ) as executor:
+        results = executor.map(propagate_metrics(get_track_by_isrc), isrcs)
+        yield from zip(isrcs, results, strict=True)
+
+
+@cache
+def get_current_user_id() -> str:
+    """Returns the ID of the authorized user, asking Spotify once per run."""
+    return get_sp().me()["id"]
+
+
 def create_playlist(title: str) -> str:
-    sp = create_sp()
-    user_id = sp.me()["id"]
-    playlist = sp.user_playlist_create(user_id, title, public=False)
-    logger.info(f"Playlist created : {playlist['id']} : {playlist['name']}")
+    sp = get_sp()
+    playlist = sp.user_playlist_create(get_current_user_id(), title, public=False)
+    logger.info("Playlist created : %s : %s", playlist["id"], playlist["name"])
     return playlist["id"]
 
 
 def add_tracks_to_playlist(playlist_id: str, tracks_ids: list[str]):
     logger.info(
-        f"Tracks added to playlist : {playlist_id} : {len(tracks_ids)} :: Start"
+        "Tracks added to playlist : %s : %s :: Start", playlist_id, len(tracks_ids)
     )
-    sp = create_sp()
+    sp = get_sp()
     for part in batched(tracks_ids, 100):
         sp.playlist_add_items(playlist_id, list(part))
-        logger.info(f"Tracks added to playlist : {playlist_id} : {len(part)}")
-    logger.info(f"Tracks added to playlist : {playlist_id} : {len(tracks_ids)} :: Done")
+        logger.info("Tracks added to playlist : %s : %s", playlist_id, len(part))
+    logger.info(
+        "Tracks added to playlist : %s : %s :: Done", playlist_id, len(tracks_ids)
+    )
     return True
+
+
+def get_playlist_tracks(playlist_id: str) -> list[str]:
+    """Returns the URIs of the tracks in a playlist, reading it page by page."""
+    sp = get_sp()
+    uris = []
+    offset = 0
+    while True:
+        page = sp.playlist_items(
+            playlist_id,
+            fields="items(track(uri)),next",
+            limit=100,
+            offset=offset,
+            additional_types=("track",),
+        )
+        uris.extend(item["track"]["uri"] for item in page["items"] if item["track"])
+        if not page["next"]:
+            return uris
+        offset += 100
+
+
+def sync_playlist_tracks(playlist_id: str, tracks_ids: list[str]) -> tuple[int, int]:
+    """
+    Makes the playlist contain exactly the given tracks.
+
+    Only the difference with the current contents is written, so syncing a
+    playlist that is already up to date costs no writes.
+
+    Returns:
+        Counts of added and removed tracks
+    """
+    logger.info("Sync playlist : %s : %s :: Start", playlist_id, len(tracks_ids))
+    current = get_playlist_tracks(playlist_id)
+    current_set, wanted_set = set(current), set(tracks_ids)
+    to_remove = [uri for uri in dict.fromkeys(current) if uri not in wanted_set]
+    to_add = [uri for uri in dict.fromkeys(tracks_ids) if uri not in current_set]
+
+    sp = get_sp()
+    for part in batched(to_remove, 100):
+        sp.playlist_remove_all_occurrences_of_items(playlist_id, list(part))
+        logger.info("Tracks removed from playlist : %s : %s", playlist_id, len(part))
+    for part in batched(to_add, 100):
+        sp.playlist_add_items(playlist_id, list(part))
+        logger.info("Tracks added to playlist : %s : %s", playlist_id, len(part))
+    logger.info(
+        "Sync playlist : %s : added=%s : removed=%s :: Done",
+        playlist_id,
+        len(to_add),
+        len(to_remove),
+    )
+    return len(to_add), len(to_remove)
@@ -2,6 +2,8 @@ import logging
 from enum import Enum
 from functools import wraps
 
+from src.clouder_beats.config import settings
+from src.clouder_beats.metrics import collect_metrics, write_prometheus_textfile
 from src.clouder_beats.mongo_adapter import save_data_mongo_by_id
 from src.clouder_beats.week_harvest import WeekHarvest
 
@@ -10,8 +12,11 @@ logger = logging.getLogger("main")
 
 class StatisticEnum(Enum):
     BEATPORT = "beatport"
+    BEATPORT_RELEASES = "beatport_release_tracks"
     SPOTIFY = "spotify"
     SP_PLAYLIST = "sp_playlist"
+    PIPELINE = "pipeline"
+    REFRESH = "refresh"
 
 
 def track_statistics(stat_type: StatisticEnum):
@@ -23,12 +28,29 @@ def track_statistics(stat_type: StatisticEnum):
             if stat_type == StatisticEnum.BEATPORT:
                 bp_item_type = kwargs.get("bp_item_type") or args[1]
                 stat_name += f"_{bp_item_type.value}"
-            result = func(*args, **kwargs)
-            stat = {"id": week_harvest.clouder_week, stat_name: result}
+            with collect_metrics() as metrics:
+                result = func(*args, **kwargs)
+            summary = metrics.summary()
+            logger.info("%s %s metrics :: %s", week_harvest, stat_name, summary)
+            stat = {
+                "id": week_harvest.clouder_week,
+                stat_name: result,
+                f"{stat_name}_metrics": summary,
+            }
             try:
                 save_data_mongo_by_id([stat], "statistics")
             except Exception as e:
-                logger.error(f"Failed to save {stat_name} statistics :: {e}")
+                logger.error("Failed to save %s statistics :: %s", stat_name, e)
+            if settings.prometheus_textfile_dir:
+                try:
+                    write_prometheus_textfile(
+                        settings.prometheus_textfile_dir,
+                        stat_name,
+                        week_harvest.clouder_week,
+                        summary,
+                    )
+                except OSError as e:
+                    logger.error("Failed to export %s metrics :: %s", stat_name, e)
             return result
 
         return wrapper
@@ -0,0 +1,81 @@
+"""
+Watermarks of harvested weeks.
+
+The watermark of a week is its newest Beatport track, by `publish_date` and
+then ID. The track query is ordered by `-publish_date`, so an incremental
+re-harvest of a week that is still filling up can stop paging once it
+reaches a track published before the watermark date.
+"""
+
+import logging
+from datetime import UTC, datetime
+
+from src.clouder_beats.mongo_adapter import (
+    aggregate_data,
+    get_data,
+    save_data_mongo_by_id,
+)
+from src.clouder_beats.week_harvest import WeekHarvest
+
+logger = logging.getLogger("collectors")
+
+WATERMARKS_COLLECTION = "harvest_watermarks"
+
+
+def get_watermark(week_harvest: WeekHarvest) -> dict | None:
+    """Returns the stored watermark of a week, if it was ever harvested."""
+    watermarks = get_data(WATERMARKS_COLLECTION, {"id": week_harvest.clouder_week})
+    return watermarks[0] if watermarks else None
+
+
+def _newest_track_pipeline(week_harvest: WeekHarvest) -> list[dict]:
+    """Returns the bp_tracks pipeline that finds the newest track of the week."""
+    return [
+        {
+            "$match": {
+                **week_harvest.track_membership,
+                "publish_date": {"$lte": week_harvest.week_end},
+            }
+        },
+        {"$sort": {"publish_date": -1, "id": -1}},
+        {"$limit": 1},
+        {"$project": {"_id": 0, "id": 1, "publish_date": 1}},
+    ]
+
+
+def update_watermark(week_harvest: WeekHarvest) -> dict | None:
+    """
+    Stores the newest Beatport track of the week as its watermark.
+
+    Tracks published after the week, which the release harvest can bring
+    in, are ignored.
+
+    Returns:
+        The new watermark, or None if the week has no tracks yet
+    """
+    newest = aggregate_data("bp_tracks", _newest_track_pipeline(week_harvest))
+    if not newest or newest[0].get("publish_date") is None:
+        return None
+    track = newest[0]
+    watermark = {
+        "id": week_harvest.clouder_week,
+        "publish_date": track["publish_date"],
+        "bp_id": track["id"],
+        "updated_at": datetime.now(UTC),
+    }
+    save_data_mongo_by_id([watermark], WATERMARKS_COLLECTION)
+    logger.info(
+        "%s Watermark :: %s : %s", week_harvest, watermark["publish_date"], track["id"]
+    )
+    return watermark
+
+
+def is_past_watermark(bp_track: dict, watermark: dict) -> bool:
+    """
+    Tells whether a track was published before the watermark date.
+
+    Tracks published on the watermark date are not past it, as they can be
+    added to the week after it was harvested and the API does not order
+    tracks of the same date.
+    """
+    return (bp_track.get("publish_date") or "") < watermark["publish_date"]
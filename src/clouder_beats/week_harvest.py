@@ -17,6 +17,8 @@ PLAYLISTS = {
 
 BASE_PLAYLIST = "base"
 
+TRACK_WEEKS_FIELD = "clouder_weeks"
+
 
 class WeekHarvest:
     def __init__(self, week: int, year: int, style_id: int):
@@ -79,6 +81,11 @@ class WeekHarvest:
         """Returns the style ID."""
         return self._style_id
 
+    @property
+    def week(self) -> int:
+        """Returns the week number."""
+        return self._week
+
     @property
     def year(self) -> int:
         """Returns the year of the week."""
@@ -94,6 +101,26 @@ class WeekHarvest:
             "category": PLAYLISTS.get(self._style_name, []),
         }
 
+    @property
+    def playlist_filters(self) -> dict[str, dict]:
+        """
+        Returns the Spotify track filters of the automatically filled playlists.
+
+        Playlists without a filter, such as the category ones, are filled by
+        hand. Adding an entry here is enough to fill another playlist.
+        """
+        return {
+            "new": {
+                "bp_genre_id": self._style_id,
+                "album.release_date": {"$gte": self.sp_week_start},
+            },
+            "old": {
+                "bp_genre_id": self._style_id,
+                "album.release_date": {"$lt": self.sp_week_start},
+            },
+            "not": {"bp_genre_id": {"$ne": self._style_id}},
+        }
+
     @property
     def _base_sp_pl_name(self) -> str:
         """Generates the base name for the specialized playlist."""
@@ -108,6 +135,16 @@ class WeekHarvest:
         """Returns a unique identifier for the week in uppercase format."""
         return f"{self._style_name}_{self._year}_{self._week}".upper()
 
+    @property
+    def track_membership(self) -> dict:
+        """
+        Returns the week's entry in the weeks array of a stored track.
+
+        Tracks are stored once across weeks, so this is both the filter of
+        the week's tracks and the value added to a track seen this week.
+        """
+        return {TRACK_WEEKS_FIELD: self.clouder_week}
+
     def __str__(self) -> str:
         """Returns the string representation of the ReleaseMeta object."""
         return self.clouder_week
@@ -0,0 +1,32 @@
+import pytest
+
+from src.clouder_beats import mongo_adapter
+from src.clouder_beats.config import settings
+
+TEST_ENV = {
+    "BP_API_URL": "https://api.beatport.test/v4/",
+    "MONGO_URL": "mongodb://localhost:27017",
+    "MONGO_DB": "clouder_test",
+    "SPOTIPY_CLIENT_ID": "client-id",
+    "SPOTIPY_CLIENT_SECRET": "client-secret",
+    "SPOTIPY_REDIRECT_URI": "http://localhost:8888/callback",
+}
+
+
+@pytest.fixture(autouse=True)
+def app_settings(monkeypatch):
+    """Fresh settings for every test, so changes made by one do not leak."""
+    for name, value in TEST_ENV.items():
+        monkeypatch.setenv(name, value)
+    settings.reset()
+    yield settings
+    settings.reset()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """An in-memory database behind the process-wide MongoDB client."""
+    mongomock = pytest.importorskip("mongomock")
+    client = mongomock.MongoClient(tz_aware=True)
+    monkeypatch.setattr(mongo_adapter, "_client", client)
+    return client[settings.mongo_db]
@@ -0,0 +1,145 @@
+import json
+import threading
+
+import pytest
+import requests
+
+from src.clouder_beats import bp_adapter
+from src.clouder_beats.bp_adapter import (
+    BPApiError,
+    BPItemType,
+    fetch_bp_pages,
+    request_bp_page,
+)
+from src.clouder_beats.week_harvest import WeekHarvest
+
+
+class FakeClock:
+    def __init__(self):
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return 0.0
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+
+
+class FakeSession:
+    """Answers requests with the given responses, in order."""
+
+    def __init__(self, *responses: requests.Response):
+        self.responses = list(responses)
+        self.tokens = []
+
+    def get(self, url, params, headers, timeout) -> requests.Response:
+        self.tokens.append(headers["Authorization"])
+        return self.responses.pop(0)
+
+
+def _response(status: int, body: dict | None = None, **headers) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body or {}).encode()
+    response.headers.update(headers)
+    return response
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(bp_adapter, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def session(monkeypatch, app_settings):
+    app_settings.bp_api_token = "old-token"
+
+    def use(*responses: requests.Response) -> FakeSession:
+        session = FakeSession(*responses)
+        monkeypatch.setattr(bp_adapter, "get_bp_session", lambda: session)
+        return session
+
+    return use
+
+
+def test_throttled_request_waits_retry_after(clock, session):
+    session(_response(429, **{"Retry-After": "3"}), _response(200, {"count": 1}))
+
+    assert request_bp_page("api.test/tracks/", {}) == {"count": 1}
+    assert clock.sleeps == [3.0]
+
+
+def test_gives_up_after_max_retries(clock, session, app_settings):
+    app_settings.bp_max_retries = 2
+    session(*[_response(503) for _ in range(3)])
+
+    with pytest.raises(BPApiError):
+        request_bp_page("api.test/tracks/", {})
+    assert len(clock.sleeps) == 2
+
+
+def test_client_error_is_not_retried(clock, session):
+    session(_response(404))
+
+    with pytest.raises(BPApiError):
+        request_bp_page("api.test/tracks/", {})
+    assert clock.sleeps == []
+
+
+def test_unauthorized_refreshes_token_once(clock, session, monkeypatch):
+    monkeypatch.setattr(bp_adapter, "get_bp_token", lambda stale: "new-token")
+    fake = session(_response(401), _response(200, {"count": 1}))
+
+    assert request_bp_page("api.test/tracks/", {}) == {"count": 1}
+    assert fake.tokens == ["Bearer old-token", "Bearer new-token"]
+    assert clock.sleeps == []
+
+
+def test_unauthorized_after_refresh_fails(clock, session, monkeypatch):
+    monkeypatch.setattr(bp_adapter, "get_bp_token", lambda stale: "new-token")
+    session(_response(401), _response(401))
+
+    with pytest.raises(BPApiError):
+        request_bp_page("api.test/tracks/", {})
+
+
+@pytest.fixture
+def pages(monkeypatch) -> list[int]:
+    """
+    Serves a week of 450 tracks in 5 pages. Pages after the first requested
+    one are answered only once the following page was requested, so they
+    complete out of order.
+    """
+    requested = []
+    started = {page: threading.Event() for page in range(1, 6)}
+
+    def request_page(url, params):
+        page = params["page"]
+        requested.append(page)
+        started[page].set()
+        if requested[0] < page < 5:
+            started[page + 1].wait(timeout=5)
+        return {"count": 450, "results": [{"id": page}], "next": None}
+
+    monkeypatch.setattr(bp_adapter, "request_bp_page", request_page)
+    return requested
+
+
+def test_concurrent_pages_keep_page_order(app_settings, pages):
+    app_settings.bp_concurrency = 4
+
+    fetched = list(fetch_bp_pages(WeekHarvest(7, 2025, 90), BPItemType.TRACK))
+
+    assert fetched == [(page, [{"id": page}]) for page in range(1, 6)]
+    assert sorted(pages) == [1, 2, 3, 4, 5]
+
+
+def test_concurrent_pages_resume_from_start_page(app_settings, pages):
+    app_settings.bp_concurrency = 4
+
+    fetched = fetch_bp_pages(WeekHarvest(7, 2025, 90), BPItemType.TRACK, start_page=3)
+
+    assert [page for page, _ in fetched] == [3, 4, 5]
+    assert sorted(pages) == [3, 4, 5]
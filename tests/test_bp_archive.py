@@ -0,0 +1,71 @@
+import pytest
+
+from src.clouder_beats import bp_adapter
+from src.clouder_beats.bp_adapter import BPItemType, fetch_bp_pages
+from src.clouder_beats.bp_archive import (
+    ArchiveMissError,
+    archive_bp_page,
+    replay_bp_pages,
+)
+from src.clouder_beats.week_harvest import WeekHarvest
+
+PAGES = {
+    1: {"count": 150, "results": [{"id": 1}], "next": "page-2"},
+    2: {"count": 150, "results": [{"id": 2}], "next": None},
+}
+
+
+@pytest.fixture
+def week_harvest() -> WeekHarvest:
+    return WeekHarvest(7, 2025, 90)
+
+
+@pytest.fixture
+def archive(tmp_path, app_settings):
+    app_settings.bp_archive_dir = str(tmp_path)
+    return tmp_path
+
+
+def test_archived_pages_replay_in_order(archive, week_harvest):
+    for page in (2, 1):
+        archive_bp_page(week_harvest, "tracks", page, 100, PAGES[page])
+
+    assert list(replay_bp_pages(week_harvest, "tracks")) == list(PAGES.items())
+    assert list(replay_bp_pages(week_harvest, "tracks", start_page=2)) == [
+        (2, PAGES[2])
+    ]
+
+
+def test_identical_pages_share_one_object(archive, week_harvest):
+    archive_bp_page(week_harvest, "tracks", 1, 100, PAGES[1])
+    archive_bp_page(WeekHarvest(8, 2025, 90), "tracks", 1, 100, PAGES[1])
+
+    assert len(list((archive / "objects").rglob("*.json.gz"))) == 1
+
+
+def test_missing_page_fails_replay(archive, week_harvest):
+    archive_bp_page(week_harvest, "tracks", 1, 100, PAGES[1])
+
+    with pytest.raises(ArchiveMissError):
+        list(replay_bp_pages(week_harvest, "tracks"))
+
+
+def test_unarchived_week_fails_replay(archive, week_harvest):
+    with pytest.raises(ArchiveMissError):
+        list(replay_bp_pages(week_harvest, "tracks"))
+
+
+def test_fetched_pages_replay_without_the_api(
+    archive, app_settings, week_harvest, monkeypatch
+):
+    app_settings.bp_concurrency = 1
+    monkeypatch.setattr(
+        bp_adapter, "request_bp_page", lambda url, params: PAGES[1 if params else 2]
+    )
+    fetched = list(fetch_bp_pages(week_harvest, BPItemType.TRACK))
+
+    app_settings.bp_replay = True
+    monkeypatch.setattr(bp_adapter, "request_bp_page", None)
+
+    assert list(fetch_bp_pages(week_harvest, BPItemType.TRACK)) == fetched
+    assert fetched == [(1, [{"id": 1}]), (2, [{"id": 2}])]
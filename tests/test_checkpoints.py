@@ -0,0 +1,50 @@
+import pytest
+
+from src.clouder_beats.checkpoints import (
+    StageStatus,
+    get_stage_state,
+    save_stage_state,
+    start_stage,
+)
+from src.clouder_beats.week_harvest import WeekHarvest
+
+
+@pytest.fixture
+def week_harvest() -> WeekHarvest:
+    return WeekHarvest(7, 2025, 90)
+
+
+def test_new_stage_starts_from_scratch(db, week_harvest):
+    assert start_stage(week_harvest, "bp_tracks") == {}
+    state = get_stage_state(week_harvest, "bp_tracks")
+    assert state["status"] == StageStatus.RUNNING.value
+
+
+def test_interrupted_stage_resumes_from_checkpoint(db, week_harvest):
+    start_stage(week_harvest, "bp_tracks")
+    save_stage_state(week_harvest, "bp_tracks", bp_page=3, streamed=False)
+    save_stage_state(week_harvest, "bp_tracks", StageStatus.FAILED)
+
+    assert start_stage(week_harvest, "bp_tracks") == {"bp_page": 3, "streamed": False}
+    state = get_stage_state(week_harvest, "bp_tracks")
+    assert state["status"] == StageStatus.RUNNING.value
+
+
+def test_done_stage_is_skipped(db, week_harvest):
+    start_stage(week_harvest, "sp_tracks")
+    save_stage_state(week_harvest, "sp_tracks", StageStatus.DONE, last_bp_id=42)
+
+    assert start_stage(week_harvest, "sp_tracks") is None
+
+
+def test_force_clears_checkpoint_of_done_stage(db, week_harvest):
+    start_stage(week_harvest, "sp_tracks")
+    save_stage_state(week_harvest, "sp_tracks", StageStatus.DONE, last_bp_id=42)
+
+    assert start_stage(week_harvest, "sp_tracks", force=True) == {}
+    assert start_stage(week_harvest, "sp_tracks") == {}
+
+
+def test_unknown_checkpoint_field_is_rejected(db, week_harvest):
+    with pytest.raises(ValueError, match="Unknown checkpoint fields"):
+        save_stage_state(week_harvest, "bp_tracks", page=1)
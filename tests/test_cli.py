@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _run_cli(*args: str, cwd: Path) -> subprocess.CompletedProcess:
+    env = {"PATH": os.environ.get("PATH", ""), "HOME": str(cwd)}
+    return subprocess.run(
+        [sys.executable, str(ROOT / "main.py"), *args],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+
+
+@pytest.mark.parametrize("args", [("--help",), ("harvest", "--help")])
+def test_help_needs_no_settings(tmp_path, args):
+    result = _run_cli(*args, cwd=tmp_path)
+
+    assert result.returncode == 0, result.stderr
+    assert "Usage" in result.stdout
+    assert not (tmp_path / "logs").exists()
+
+
+def test_command_reads_settings(tmp_path):
+    result = _run_cli("ensure-indexes", cwd=tmp_path)
+
+    assert result.returncode != 0
+    assert "mongo_url" in result.stderr
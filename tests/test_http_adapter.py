@@ -0,0 +1,54 @@
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.clouder_beats.http_adapter import LimitedHTTPAdapter, retry_after_seconds
+from src.clouder_beats.rate_limiter import AdaptiveLimiter
+
+
+def _response(retry_after: str | None = None) -> requests.Response:
+    response = requests.Response()
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return response
+
+
+def test_retry_after_in_seconds():
+    assert retry_after_seconds(_response("3")) == 3.0
+
+
+def test_retry_after_as_http_date():
+    retry_at = formatdate(time.time() + 30, usegmt=True)
+
+    assert 25 < retry_after_seconds(_response(retry_at)) <= 30
+
+
+def test_retry_after_in_the_past_is_zero():
+    retry_at = formatdate(time.time() - 30, usegmt=True)
+
+    assert retry_after_seconds(_response(retry_at)) == 0
+
+
+@pytest.mark.parametrize("retry_after", [None, "", "soon"])
+def test_missing_or_invalid_retry_after(retry_after):
+    assert retry_after_seconds(_response(retry_after)) is None
+
+
+def test_failed_request_shrinks_window(monkeypatch):
+    limiter = AdaptiveLimiter("test", rate=1000, max_concurrency=8, cooldown=0)
+    adapter = LimitedHTTPAdapter(limiter)
+
+    def send(self, request, *args, **kwargs):
+        raise requests.ConnectionError("refused")
+
+    monkeypatch.setattr(HTTPAdapter, "send", send)
+    session = requests.Session()
+    session.mount("http://", adapter)
+
+    with pytest.raises(requests.ConnectionError):
+        session.get("http://api.test/")
+
+    assert limiter.concurrency == 2
@@ -0,0 +1,58 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from src.clouder_beats.isrc_cache import (
+    ISRC_CACHE_COLLECTION,
+    prefetch_isrc_cache,
+    store_isrc_cache,
+)
+
+SP_TRACK = {"id": "sp1", "uri": "spotify:track:sp1"}
+
+
+@pytest.fixture
+def cache(db):
+    store_isrc_cache({"FOUND": SP_TRACK, "MISSING": None})
+    return db[ISRC_CACHE_COLLECTION]
+
+
+def _age(cache, isrc: str, days: int):
+    cache.update_one(
+        {"id": isrc},
+        {"$set": {"cached_at": datetime.now(UTC) - timedelta(days=days)}},
+    )
+
+
+def test_prefetch_returns_found_and_not_found_entries(cache):
+    assert prefetch_isrc_cache(["FOUND", "MISSING", "UNKNOWN"]) == {
+        "FOUND": SP_TRACK,
+        "MISSING": None,
+    }
+
+
+def test_not_found_entries_expire_first(cache):
+    _age(cache, "FOUND", 4)
+    _age(cache, "MISSING", 4)
+
+    assert prefetch_isrc_cache(["FOUND", "MISSING"]) == {"FOUND": SP_TRACK}
+
+
+def test_found_entries_expire_after_ttl(cache):
+    _age(cache, "FOUND", 31)
+
+    assert prefetch_isrc_cache(["FOUND"]) == {}
+
+
+def test_new_result_replaces_entry(cache):
+    _age(cache, "MISSING", 4)
+
+    store_isrc_cache({"MISSING": SP_TRACK})
+
+    assert prefetch_isrc_cache(["MISSING"]) == {"MISSING": SP_TRACK}
+
+
+def test_disabled_cache_is_never_read(cache, app_settings):
+    app_settings.isrc_cache_enabled = False
+
+    assert prefetch_isrc_cache(["FOUND"]) == {}
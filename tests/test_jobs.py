@@ -0,0 +1,166 @@
+import time
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from src.clouder_beats import jobs
+from src.clouder_beats.indexes import ensure_indexes
+from src.clouder_beats.jobs import JobStatus
+from src.clouder_beats.week_harvest import WeekHarvest
+
+
+@pytest.fixture
+def week_harvest(db) -> WeekHarvest:
+    ensure_indexes()
+    week_harvest = WeekHarvest(7, 2025, 90)
+    jobs.enqueue_harvest(week_harvest)
+    return week_harvest
+
+
+def _expire_lease(db, job: dict):
+    db.harvest_jobs.update_one(
+        {"id": job["id"]},
+        {"$set": {"lease_expires_at": datetime.now(UTC) - timedelta(seconds=1)}},
+    )
+
+
+def test_enqueue_is_idempotent_while_pending(db, week_harvest):
+    assert not jobs.enqueue_harvest(week_harvest)
+    assert db.harvest_jobs.count_documents({}) == 1
+
+
+def test_claim_leases_job_once(db, week_harvest):
+    job = jobs.claim_job("worker-a")
+
+    assert job["stage"] == "bp_tracks"
+    assert job["status"] == JobStatus.RUNNING.value
+    assert job["lease_owner"] == "worker-a"
+    assert job["attempts"] == 1
+    assert jobs.claim_job("worker-b") is None
+
+
+def test_only_lease_owner_renews(db, week_harvest):
+    job = jobs.claim_job("worker-a")
+
+    assert jobs.renew_lease(job, "worker-a")
+    assert not jobs.renew_lease(job, "worker-b")
+
+
+def test_failed_job_is_retried_after_delay(db, week_harvest, app_settings):
+    app_settings.job_retry_delay = 30
+    job = jobs.claim_job("worker-a")
+
+    jobs.fail_job(job, "worker-a", "boom")
+
+    stored = db.harvest_jobs.find_one({"id": job["id"]})
+    assert stored["status"] == JobStatus.PENDING.value
+    assert stored["error"] == "boom"
+    assert stored["lease_owner"] is None
+    delay = stored["available_at"] - datetime.now(UTC)
+    assert timedelta(seconds=25) < delay <= timedelta(seconds=30)
+    assert jobs.claim_job("worker-b") is None
+
+    db.harvest_jobs.update_one(
+        {"id": job["id"]}, {"$set": {"available_at": datetime.now(UTC)}}
+    )
+    assert jobs.claim_job("worker-b")["attempts"] == 2
+
+
+def test_job_fails_after_last_attempt(db, week_harvest, app_settings):
+    app_settings.job_max_attempts = 1
+    job = jobs.claim_job("worker-a")
+
+    jobs.fail_job(job, "worker-a", "boom")
+
+    stored = db.harvest_jobs.find_one({"id": job["id"]})
+    assert stored["status"] == JobStatus.FAILED.value
+
+
+def test_expired_lease_is_claimed_by_another_worker(db, week_harvest):
+    job = jobs.claim_job("worker-a")
+    _expire_lease(db, job)
+
+    reclaimed = jobs.claim_job("worker-b")
+
+    assert reclaimed["lease_owner"] == "worker-b"
+    assert reclaimed["attempts"] == 2
+    assert not jobs.renew_lease(job, "worker-a")
+
+
+def test_expired_lease_on_last_attempt_fails_job(db, week_harvest, app_settings):
+    app_settings.job_max_attempts = 1
+    job = jobs.claim_job("worker-a")
+    _expire_lease(db, job)
+
+    assert jobs.fail_expired_jobs() == 1
+    stored = db.harvest_jobs.find_one({"id": job["id"]})
+    assert stored["status"] == JobStatus.FAILED.value
+    assert stored["error"] == "Lease expired"
+
+
+def test_completed_job_queues_next_stage(db, week_harvest):
+    job = jobs.claim_job("worker-a")
+
+    assert jobs.complete_job(job, "worker-a")
+
+    stored = db.harvest_jobs.find_one({"id": job["id"]})
+    assert stored["status"] == JobStatus.DONE.value
+    assert jobs.claim_job("worker-a")["stage"] == "sp_tracks"
+
+
+def test_job_is_not_completed_after_lease_loss(db, week_harvest, monkeypatch):
+    job = jobs.claim_job("worker-a")
+    ran = []
+
+    def run_stage(week_harvest, stage, force=False):
+        ran.append(stage)
+        _expire_lease(db, job)
+        assert jobs.claim_job("worker-b") is not None
+
+    monkeypatch.setattr(jobs, "save_clouder_week", lambda week_harvest: None)
+    monkeypatch.setattr(jobs, "run_stage", run_stage)
+
+    assert not jobs.run_job(job, "worker-a")
+    assert ran == ["bp_tracks"]
+    stored = db.harvest_jobs.find_one({"id": job["id"]})
+    assert stored["status"] == JobStatus.RUNNING.value
+    assert stored["lease_owner"] == "worker-b"
+
+
+def test_stage_does_not_start_without_lease(db, week_harvest, monkeypatch):
+    job = jobs.claim_job("worker-a")
+    _expire_lease(db, job)
+    jobs.claim_job("worker-b")
+    ran = []
+    monkeypatch.setattr(jobs, "save_clouder_week", lambda week_harvest: None)
+    monkeypatch.setattr(jobs, "run_stage", lambda *args, **kwargs: ran.append(1))
+
+    assert not jobs.run_job(job, "worker-a")
+    assert ran == []
+
+
+def test_claimed_job_matches_stored_lease(db, week_harvest):
+    job = jobs.claim_job("worker-a")
+
+    stored = db.harvest_jobs.find_one({"id": job["id"]}, {"_id": 0})
+    assert job.keys() == stored.keys()
+    for field in ("status", "lease_owner", "attempts", "stage"):
+        assert job[field] == stored[field]
+    drift = abs(job["lease_expires_at"] - stored["lease_expires_at"])
+    assert drift < timedelta(milliseconds=1)
+
+
+def test_heartbeat_reports_lost_lease(db, week_harvest, app_settings, monkeypatch):
+    app_settings.job_heartbeat_seconds = 0.01
+    job = jobs.claim_job("worker-a")
+
+    def run_stage(week_harvest, stage, force=False):
+        _expire_lease(db, job)
+        jobs.claim_job("worker-b")
+        time.sleep(0.1)
+
+    monkeypatch.setattr(jobs, "save_clouder_week", lambda week_harvest: None)
+    monkeypatch.setattr(jobs, "complete_job", lambda *args: pytest.fail("completed"))
+    monkeypatch.setattr(jobs, "run_stage", run_stage)
+
+    assert not jobs.run_job(job, "worker-a")
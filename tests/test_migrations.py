@@ -0,0 +1,74 @@
+import pytest
+
+from src.clouder_beats.indexes import ensure_indexes
+from src.clouder_beats.migrations import migrate_track_store
+from src.clouder_beats.mongo_adapter import CONTENT_HASH_FIELD, content_hash
+
+
+@pytest.fixture
+def bp_tracks(db):
+    bp_tracks = db["bp_tracks"]
+    bp_tracks.insert_many(
+        [
+            {"id": 1, "clouder_week": "w1", "name": "old"},
+            {"id": 1, "clouder_week": "w2", "name": "new"},
+            {"id": 2, "clouder_week": "w1", "name": "single"},
+            {"id": 3, "clouder_weeks": ["w3"], "name": "current"},
+            {"id": 3, "clouder_week": "w1", "name": "legacy"},
+        ]
+    )
+    return bp_tracks
+
+
+def _tracks(collection) -> dict[int, dict]:
+    return {doc["id"]: doc for doc in collection.find({}, {"_id": 0})}
+
+
+def test_weeks_fold_into_one_document(bp_tracks):
+    assert migrate_track_store(batch_size=2) == {"bp_tracks": 3, "sp_tracks": 0}
+
+    assert bp_tracks.count_documents({}) == 3
+    assert bp_tracks.count_documents({"clouder_week": {"$exists": True}}) == 0
+    tracks = _tracks(bp_tracks)
+    assert tracks[1] == {
+        "id": 1,
+        "name": "new",
+        "clouder_weeks": ["w1", "w2"],
+        CONTENT_HASH_FIELD: content_hash({"id": 1, "name": "new"}),
+    }
+    assert tracks[2]["clouder_weeks"] == ["w1"]
+
+
+def test_current_document_only_gets_the_weeks(bp_tracks):
+    migrate_track_store()
+
+    track = _tracks(bp_tracks)[3]
+    assert track["name"] == "current"
+    assert sorted(track["clouder_weeks"]) == ["w1", "w3"]
+
+
+def test_migration_runs_again_as_a_no_op(bp_tracks):
+    migrate_track_store()
+    migrated = _tracks(bp_tracks)
+
+    assert migrate_track_store() == {"bp_tracks": 0, "sp_tracks": 0}
+    assert _tracks(bp_tracks) == migrated
+
+
+def test_legacy_indexes_are_replaced(bp_tracks):
+    bp_tracks.create_index([("clouder_week", 1), ("id", 1)], name="clouder_week_id")
+
+    migrate_track_store()
+
+    indexes = bp_tracks.index_information()
+    assert "clouder_week_id" not in indexes
+    assert indexes["id"]["unique"]
+
+
+def test_legacy_documents_migrate_under_the_unique_index(bp_tracks):
+    migrate_track_store()
+    ensure_indexes()
+    bp_tracks.insert_one({"id": 4, "clouder_week": "w5", "name": "late"})
+
+    assert migrate_track_store() == {"bp_tracks": 1, "sp_tracks": 0}
+    assert _tracks(bp_tracks)[4]["clouder_weeks"] == ["w5"]
@@ -0,0 +1,71 @@
+import pytest
+from pymongo import errors
+
+from src.clouder_beats.mongo_adapter import keys_filter, save_data_mongo_by_id
+
+
+def _tracks(*names: str) -> list[dict]:
+    return [{"id": index, "name": name} for index, name in enumerate(names)]
+
+
+def test_new_documents_are_inserted(db):
+    assert save_data_mongo_by_id(_tracks("a", "b"), "bp_tracks") == (2, 0, 0)
+    assert db.bp_tracks.count_documents({}) == 2
+
+
+def test_unchanged_documents_are_not_written(db):
+    save_data_mongo_by_id(_tracks("a", "b"), "bp_tracks")
+
+    assert save_data_mongo_by_id(_tracks("a", "b"), "bp_tracks") == (0, 0, 2)
+
+
+def test_changed_documents_are_updated(db):
+    save_data_mongo_by_id(_tracks("a", "b"), "bp_tracks")
+
+    assert save_data_mongo_by_id(_tracks("a", "c"), "bp_tracks") == (0, 1, 1)
+    assert db.bp_tracks.find_one({"id": 1})["name"] == "c"
+
+
+def test_membership_is_added_to_unchanged_documents(db):
+    save_data_mongo_by_id(_tracks("a"), "bp_tracks", add_to_set={"clouder_weeks": "W1"})
+
+    counts = save_data_mongo_by_id(
+        _tracks("a"), "bp_tracks", add_to_set={"clouder_weeks": "W2"}
+    )
+
+    assert counts == (0, 0, 1)
+    assert db.bp_tracks.find_one({"id": 0})["clouder_weeks"] == ["W1", "W2"]
+
+
+def test_write_errors_are_swallowed_unless_asked(db, monkeypatch):
+    def bulk_write(*args, **kwargs):
+        raise errors.PyMongoError("write failed")
+
+    monkeypatch.setattr(type(db.bp_tracks), "bulk_write", bulk_write)
+
+    assert save_data_mongo_by_id(_tracks("a"), "bp_tracks") == (0, 0, 0)
+    with pytest.raises(errors.PyMongoError, match="write failed"):
+        save_data_mongo_by_id(_tracks("a"), "bp_tracks", raise_errors=True)
+
+
+def test_single_field_keys_are_matched_with_in():
+    keys = [{"id": 1}, {"id": 2}]
+
+    assert keys_filter(["id"], keys) == {"id": {"$in": [1, 2]}}
+
+
+def test_composite_keys_are_matched_with_or():
+    keys = [{"week": 1, "year": 2025}, {"week": 2, "year": 2025}]
+
+    assert keys_filter(["week", "year"], keys) == {"$or": keys}
+
+
+def test_composite_keys_detect_unchanged_documents(db):
+    weeks = [{"week": 1, "year": 2025, "name": "a"}]
+    save_data_mongo_by_id(weeks, "weeks", key_fields=["week", "year"])
+
+    assert save_data_mongo_by_id(weeks, "weeks", key_fields=["week", "year"]) == (
+        0,
+        0,
+        1,
+    )
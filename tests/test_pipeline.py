@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+from src.clouder_beats.pipeline import run_pipeline
+
+
+def test_items_go_through_stages_in_order():
+    written = []
+
+    run_pipeline(range(20), lambda item: item * 2, written.append, queue_size=2)
+
+    assert written == [item * 2 for item in range(20)]
+
+
+def test_failing_stage_aborts_pipeline():
+    produced, written = [], []
+    closed = threading.Event()
+
+    def source():
+        try:
+            for item in range(1000):
+                produced.append(item)
+                yield item
+        finally:
+            closed.set()
+
+    def resolve(item):
+        if item == 3:
+            raise ValueError("resolve failed")
+        return item
+
+    with pytest.raises(ValueError, match="resolve failed"):
+        run_pipeline(source(), resolve, written.append, queue_size=2)
+
+    assert closed.is_set()
+    assert len(produced) < 1000
+    assert written == [0, 1, 2]
+
+
+def test_failing_source_lets_finished_items_drain():
+    written = []
+
+    def source():
+        yield from range(5)
+        raise ConnectionError("page request failed")
+
+    with pytest.raises(ConnectionError, match="page request failed"):
+        run_pipeline(source(), lambda item: item, written.append, queue_size=2)
+
+    assert written == [0, 1, 2, 3, 4]
@@ -0,0 +1,49 @@
+from src.clouder_beats.projection import _apply, _compile, project
+
+
+def test_apply_keeps_whitelisted_fields_of_list_items():
+    tree = _compile(["id", "artists.name"])
+    document = {
+        "id": 1,
+        "slug": "track",
+        "artists": [{"id": 10, "name": "A"}, {"id": 11, "name": "B"}],
+    }
+
+    assert _apply(document, tree) == {
+        "id": 1,
+        "artists": [{"name": "A"}, {"name": "B"}],
+    }
+
+
+def test_apply_projects_every_document_of_a_list():
+    tree = _compile(["id"])
+
+    assert _apply([{"id": 1, "x": 2}, {"id": 3}], tree) == [{"id": 1}, {"id": 3}]
+
+
+def test_apply_keeps_none_and_scalar_values():
+    tree = _compile(["genre.id", "key.name", "bpm"])
+    document = {"genre": None, "key": "A minor", "bpm": None}
+
+    assert _apply(document, tree) == document
+
+
+def test_apply_skips_missing_fields():
+    tree = _compile(["release.id", "label.name"])
+
+    assert _apply({"release": {"name": "R"}}, tree) == {"release": {}}
+
+
+def test_project_leaves_none_and_unknown_collections():
+    assert project("bp_tracks", None) is None
+    assert project("clouder_weeks", {"week": 1, "extra": 2}) == {
+        "week": 1,
+        "extra": 2,
+    }
+
+
+def test_project_can_be_disabled(app_settings):
+    app_settings.projection_enabled = False
+    document = {"id": 1, "slug": "track"}
+
+    assert project("bp_tracks", document) == document
@@ -0,0 +1,94 @@
+import pytest
+
+from src.clouder_beats import rate_limiter
+from src.clouder_beats.rate_limiter import AdaptiveLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+def _call(limiter: AdaptiveLimiter, latency: float = 0.1, **kwargs):
+    limiter.acquire()
+    limiter.release(latency, **kwargs)
+
+
+def test_window_grows_on_success(clock):
+    limiter = AdaptiveLimiter("test", rate=1000, max_concurrency=8)
+    assert limiter.concurrency == 4
+
+    for _ in range(5):
+        _call(limiter)
+
+    assert limiter.concurrency == 5
+
+
+def test_window_stops_at_max_concurrency(clock):
+    limiter = AdaptiveLimiter("test", rate=1000, max_concurrency=4)
+
+    for _ in range(50):
+        _call(limiter)
+
+    assert limiter.concurrency == 4
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"throttled": True},
+        {"failed": True},
+        {"latency": 5.0},
+    ],
+)
+def test_window_halves_on_decrease_signal(clock, kwargs):
+    limiter = AdaptiveLimiter("test", rate=1000, max_concurrency=16, latency_target=2.0)
+    assert limiter.concurrency == 8
+
+    _call(limiter, **kwargs)
+
+    assert limiter.concurrency == 4
+
+
+def test_decrease_respects_cooldown(clock):
+    limiter = AdaptiveLimiter("test", rate=1000, max_concurrency=16, cooldown=5.0)
+
+    limiter.throttle()
+    limiter.throttle()
+    assert limiter.concurrency == 4
+
+    clock.now += 5.0
+    limiter.throttle()
+    assert limiter.concurrency == 2
+
+
+def test_window_never_drops_below_one(clock):
+    limiter = AdaptiveLimiter("test", rate=1000, max_concurrency=2, cooldown=0)
+
+    for _ in range(5):
+        limiter.throttle()
+
+    assert limiter.concurrency == 1
+
+
+def test_retry_after_pauses_every_caller(clock):
+    limiter = AdaptiveLimiter("test", rate=1000, max_concurrency=4)
+
+    limiter.throttle(retry_after=3.0)
+    started = clock.now
+    limiter.acquire()
+
+    assert clock.now - started == pytest.approx(3.0)
@@ -0,0 +1,80 @@
+import pytest
+
+from src.clouder_beats import sp_adapter
+from src.clouder_beats.sp_adapter import get_playlist_tracks, sync_playlist_tracks
+
+
+class FakeSpotify:
+    """Holds one playlist and records the writes made to it."""
+
+    def __init__(self, uris: list[str]):
+        self.uris = list(uris)
+        self.writes = []
+
+    def playlist_items(self, playlist_id, fields, limit, offset, additional_types):
+        items = [{"track": {"uri": uri}} for uri in self.uris[offset : offset + limit]]
+        has_next = offset + limit < len(self.uris)
+        return {"items": items, "next": "next-page" if has_next else None}
+
+    def playlist_remove_all_occurrences_of_items(self, playlist_id, uris):
+        self.writes.append(("remove", len(uris)))
+        self.uris = [uri for uri in self.uris if uri not in uris]
+
+    def playlist_add_items(self, playlist_id, uris):
+        self.writes.append(("add", len(uris)))
+        self.uris.extend(uris)
+
+
+def _uris(start: int, stop: int) -> list[str]:
+    return [f"spotify:track:{i}" for i in range(start, stop)]
+
+
+@pytest.fixture
+def playlist(monkeypatch):
+    def use(uris: list[str]) -> FakeSpotify:
+        sp = FakeSpotify(uris)
+        monkeypatch.setattr(sp_adapter, "get_sp", lambda: sp)
+        return sp
+
+    return use
+
+
+def test_playlist_tracks_are_read_page_by_page(playlist):
+    playlist(_uris(0, 250))
+
+    assert get_playlist_tracks("pl") == _uris(0, 250)
+
+
+def test_up_to_date_playlist_is_not_written(playlist):
+    sp = playlist(_uris(0, 150))
+
+    assert sync_playlist_tracks("pl", list(reversed(_uris(0, 150)))) == (0, 0)
+    assert sp.writes == []
+
+
+def test_only_the_difference_is_written(playlist):
+    sp = playlist(_uris(0, 10))
+
+    assert sync_playlist_tracks("pl", _uris(5, 15)) == (5, 5)
+    assert sp.writes == [("remove", 5), ("add", 5)]
+    assert sorted(sp.uris) == sorted(_uris(5, 15))
+
+
+def test_writes_are_batched_by_100(playlist):
+    sp = playlist(_uris(0, 120))
+
+    assert sync_playlist_tracks("pl", _uris(120, 350)) == (230, 120)
+    assert sp.writes == [
+        ("remove", 100),
+        ("remove", 20),
+        ("add", 100),
+        ("add", 100),
+        ("add", 30),
+    ]
+
+
+def test_duplicate_tracks_are_added_once(playlist):
+    sp = playlist([])
+
+    assert sync_playlist_tracks("pl", _uris(0, 3) + _uris(0, 3)) == (3, 0)
+    assert sp.uris == _uris(0, 3)
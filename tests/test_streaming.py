@@ -0,0 +1,86 @@
+import pytest
+
+from src.clouder_beats import collectors
+from src.clouder_beats.checkpoints import (
+    StageStatus,
+    get_stage_state,
+    save_stage_state,
+    start_stage,
+)
+from src.clouder_beats.limits import Resource
+from src.clouder_beats.week_harvest import WeekHarvest
+
+
+@pytest.fixture
+def week_harvest() -> WeekHarvest:
+    return WeekHarvest(7, 2025, 90)
+
+
+@pytest.fixture
+def calls(db, monkeypatch) -> list:
+    calls = []
+    monkeypatch.setattr(
+        collectors,
+        "stream_tracks",
+        lambda week_harvest, checkpoint: calls.append(("stream", checkpoint)),
+    )
+    monkeypatch.setitem(
+        collectors.STAGES,
+        "sp_tracks",
+        (
+            lambda week_harvest, checkpoint: calls.append(("sp_tracks", checkpoint)),
+            Resource.SPOTIFY,
+            True,
+        ),
+    )
+    return calls
+
+
+def _interrupt(week_harvest: WeekHarvest, **checkpoint):
+    start_stage(week_harvest, "bp_tracks")
+    save_stage_state(week_harvest, "bp_tracks", StageStatus.FAILED, **checkpoint)
+
+
+def _status(week_harvest: WeekHarvest, stage: str) -> str:
+    return get_stage_state(week_harvest, stage)["status"]
+
+
+def test_stream_covers_sp_tracks(week_harvest, calls):
+    collectors.run_streamed_stages(week_harvest)
+
+    assert calls == [("stream", {})]
+    assert _status(week_harvest, "sp_tracks") == StageStatus.DONE.value
+
+
+def test_streamed_checkpoint_resumes_stream_only(week_harvest, calls):
+    _interrupt(week_harvest, bp_page=4, streamed=True)
+
+    collectors.run_streamed_stages(week_harvest)
+
+    assert calls == [("stream", {"bp_page": 4, "streamed": True})]
+
+
+@pytest.mark.parametrize("checkpoint", [{"streamed": False}, {}])
+def test_checkpoint_not_streamed_runs_sp_tracks_after(week_harvest, calls, checkpoint):
+    _interrupt(week_harvest, bp_page=4, **checkpoint)
+
+    collectors.run_streamed_stages(week_harvest)
+
+    assert calls == [("stream", {"bp_page": 4, **checkpoint}), ("sp_tracks", {})]
+    assert _status(week_harvest, "bp_tracks") == StageStatus.DONE.value
+    assert _status(week_harvest, "sp_tracks") == StageStatus.DONE.value
+
+
+def test_partial_week_runs_sp_tracks_after(week_harvest, calls):
+    collectors.run_streamed_stages(week_harvest, whole_week=False)
+
+    assert calls == [("stream", {}), ("sp_tracks", {})]
+
+
+def test_done_beatport_tracks_run_sp_tracks_alone(week_harvest, calls):
+    start_stage(week_harvest, "bp_tracks")
+    save_stage_state(week_harvest, "bp_tracks", StageStatus.DONE)
+
+    collectors.run_streamed_stages(week_harvest)
+
+    assert calls == [("sp_tracks", {})]
@@ -0,0 +1,105 @@
+import pytest
+
+from src.clouder_beats import collectors
+from src.clouder_beats.watermarks import (
+    get_watermark,
+    is_past_watermark,
+    update_watermark,
+)
+from src.clouder_beats.week_harvest import TRACK_WEEKS_FIELD, WeekHarvest
+
+
+@pytest.fixture
+def week_harvest() -> WeekHarvest:
+    return WeekHarvest(7, 2025, 90)
+
+
+def _track(track_id: int, publish_date: str) -> dict:
+    return {"id": track_id, "isrc": f"ISRC{track_id}", "publish_date": publish_date}
+
+
+def _store(db, week_harvest: WeekHarvest, *tracks: dict):
+    db["bp_tracks"].insert_many(
+        [{**track, TRACK_WEEKS_FIELD: [week_harvest.clouder_week]} for track in tracks]
+    )
+
+
+def test_watermark_is_newest_track_of_the_week(db, week_harvest):
+    _store(
+        db,
+        week_harvest,
+        _track(1, "2025-02-20"),
+        _track(3, "2025-02-21"),
+        _track(2, "2025-02-21"),
+        _track(4, "2025-02-25"),
+    )
+    db["bp_tracks"].insert_one({**_track(5, "2025-02-22"), TRACK_WEEKS_FIELD: []})
+
+    watermark = update_watermark(week_harvest)
+
+    assert watermark["publish_date"] == "2025-02-21"
+    assert watermark["bp_id"] == 3
+    assert get_watermark(week_harvest)["bp_id"] == 3
+
+
+def test_week_without_tracks_has_no_watermark(db, week_harvest):
+    assert update_watermark(week_harvest) is None
+    assert get_watermark(week_harvest) is None
+
+
+@pytest.mark.parametrize(
+    ("publish_date", "past"),
+    [("2025-02-19", True), ("2025-02-20", False), ("2025-02-21", False), (None, True)],
+)
+def test_is_past_watermark(publish_date, past):
+    watermark = {"publish_date": "2025-02-20"}
+
+    assert is_past_watermark({"publish_date": publish_date}, watermark) is past
+
+
+@pytest.fixture
+def refresh(db, monkeypatch) -> dict:
+    """Serves three pages newest first and records what goes to Spotify."""
+    calls = {"pages": [], "sp_chunks": []}
+    pages = {
+        1: [_track(6, "2025-02-22"), _track(5, "2025-02-21")],
+        2: [_track(4, "2025-02-20"), _track(3, "2025-02-19")],
+        3: [_track(2, "2025-02-18"), _track(1, "2025-02-17")],
+    }
+
+    def fetch_bp_pages(week_harvest, bp_item_type, serial=False):
+        assert serial
+        for page, items in pages.items():
+            calls["pages"].append(page)
+            yield page, items
+
+    def collect_sp_chunk(week_harvest, bp_tracks):
+        calls["sp_chunks"].append([bp_track["id"] for bp_track in bp_tracks])
+        return {"found": len(bp_tracks), "searched": 0, "inserted": len(bp_tracks)}
+
+    monkeypatch.setattr(collectors, "fetch_bp_pages", fetch_bp_pages)
+    monkeypatch.setattr(collectors, "collect_sp_chunk", collect_sp_chunk)
+    return calls
+
+
+def test_refresh_stops_at_the_watermark(db, week_harvest, refresh):
+    statistic = collectors.refresh_tracks(week_harvest, {"publish_date": "2025-02-20"})
+
+    assert refresh["pages"] == [1, 2]
+    assert refresh["sp_chunks"] == [[6, 5, 4]]
+    assert statistic["pages"] == 2
+    assert statistic["full_cnt"] == 4
+    assert statistic["inserted"] == 4
+    assert statistic["spotify"] == {"found": 3, "searched": 0, "inserted": 3}
+    stored = db["bp_tracks"].find({TRACK_WEEKS_FIELD: week_harvest.clouder_week})
+    assert sorted(track["id"] for track in stored) == [3, 4, 5, 6]
+
+
+def test_refresh_sends_tracks_to_spotify_in_chunks(
+    db, week_harvest, refresh, app_settings
+):
+    app_settings.sp_chunk_size = 2
+
+    collectors.refresh_tracks(week_harvest, {"publish_date": "2025-02-20"})
+
+    assert refresh["sp_chunks"] == [[6, 5], [4]]